@@ -25,6 +25,16 @@ echo "Starting cron service..."
 crontab /etc/cron.d/feed-ingestion-cron
 service cron start
 
+echo "Starting ingestion daemon..."
+
+# Run the ingestion daemon in the background, restarting it if it exits
+(
+  while true; do
+    python -m src.ingest --daemon >> /var/log/ingest.log 2>&1
+    sleep 10
+  done
+) &
+
 echo "Starting main application..."
 
 # Start the main application
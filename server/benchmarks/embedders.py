@@ -0,0 +1,53 @@
+"""
+Measure embedding throughput of the embedder backends on the captured feed item corpus.
+
+Each item goes through the same processing as during ingestion and the resulting embedding inputs are
+embedded in batches, without touching the database or the embedding cache.
+
+Run from the /server directory with `uv run -m benchmarks.embedders --backend fake --backend ollama`. The
+onnx backend reads its model from ONNX_MODEL_DIR.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from benchmarks.item_processing import CORPUS_PATH, to_feed_item
+from src import constants, embedders, items
+
+
+async def run(backend: str, texts: list[str], repeat: int):
+  embedder = embedders.create_embedder(backend)
+
+  # Warm up, the first call can include loading the model
+  await embedder.embed(texts[: embedder.batch_size])
+
+  start = time.perf_counter()
+  for _ in range(repeat):
+    embeddings = await embedder.embed(texts)
+  elapsed = time.perf_counter() - start
+
+  count = len(texts) * repeat
+  print(
+    f"{backend:>8} ({embedder.model_name}): {count / elapsed:8.1f} items/s "
+    f"({elapsed * 1e3 / count:.1f} ms per item, dim {embeddings.shape[1]})"
+  )
+
+
+async def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--backend", action="append", choices=["ollama", "onnx", "fake"], help="Backends to measure")
+  parser.add_argument("--repeat", type=int, default=3, help="Number of passes over the corpus")
+  args = parser.parse_args()
+
+  with open(CORPUS_PATH, "r") as f:
+    corpus = [to_feed_item(x) for x in json.load(f)]
+  texts = [items.get_embedding_input(x.title, items.process_item(x).text).text for x in corpus]
+
+  print(f"Embedding {len(texts)} items {args.repeat} times in batches of {constants.EMBED_BATCH_SIZE}")
+  for backend in args.backend or ["fake"]:
+    await run(backend, texts, args.repeat)
+
+
+if __name__ == "__main__":
+  asyncio.run(main())
@@ -0,0 +1,141 @@
+"""
+Assert that the hot non-vector predicates are served by their indexes.
+
+Seeds a local database inside a transaction, runs EXPLAIN on the queries from service.py, ingest.py
+and prune.py and checks that each plan uses the index it was built for. Everything is rolled back.
+
+Run from the /server directory with `uv run -m benchmarks.explain_plans`
+"""
+
+import asyncio
+import json
+import sys
+from src import database, constants
+
+SEED_QUERIES = [
+  "INSERT INTO sources (id, url, source_type) VALUES (-1, 'https://example.com/explain.xml', 'rss')",
+  """INSERT INTO users (id, embedding)
+     SELECT 'explain_' || i, array_fill(0.1::real, ARRAY[:embed_dim])::vector
+     FROM generate_series(1, 200) i""",
+  """INSERT INTO content (title, url, description, source_id, date, embedding, content_type)
+     SELECT 'Item ' || i, 'https://example.com/explain/' || i, '', -1,
+            CURRENT_TIMESTAMP - (i % 336) * INTERVAL '1 hour',
+            array_fill(0.1::real, ARRAY[:embed_dim])::vector,
+            'article'
+     FROM generate_series(1, 5000) i""",
+  """INSERT INTO user_content_ratings (user_id, content_id, rating)
+     SELECT 'explain_' || (i % 200 + 1), c.id, 1
+     FROM content c, generate_series(1, 2) i
+     WHERE c.source_id = -1""",
+  """INSERT INTO ingestion_jobs (source_id, start_time, status, items_processed, items_added)
+     SELECT -1, CURRENT_TIMESTAMP - i * INTERVAL '10 minutes',
+            CASE WHEN i % 10 = 0 THEN 'failed' ELSE 'completed' END, 0, 0
+     FROM generate_series(1, 5000) i""",
+  """INSERT INTO user_flavours (user_id, embedding)
+     SELECT 'explain_' || (i % 200 + 1), array_fill(0.1::real, ARRAY[:embed_dim])::vector
+     FROM generate_series(1, 1000) i""",
+  "ANALYZE content, user_content_ratings, ingestion_jobs, user_flavours",
+]
+
+# (description, query, values, indexes of which at least one must appear in the plan)
+EXPECTED_PLANS = [
+  (
+    "service.get_recommendation_candidates age filter and rating join",
+    """SELECT c.id, c.date
+       FROM content c
+       LEFT JOIN user_content_ratings ucr ON c.id = ucr.content_id AND ucr.user_id = :user_id
+       WHERE c.date >= CURRENT_DATE - INTERVAL '7 days'
+       AND (ucr.rating IS NULL OR ucr.rating >= 0)""",
+    {"user_id": "explain_1"},
+    ["ix_content_date"],
+  ),
+  (
+    "service.get_recommendations hydration rating join",
+    """SELECT c.id, COALESCE(ucr.rating, 0) as rating
+       FROM content c
+       LEFT JOIN user_content_ratings ucr ON c.id = ucr.content_id AND ucr.user_id = :user_id
+       WHERE c.id IN (SELECT UNNEST(cast(:content_ids as int[])))""",
+    {"user_id": "explain_1", "content_ids": [1, 2, 3]},
+    ["ix_user_content_ratings_content_id_user_id", "uq_user_content_rating"],
+  ),
+  (
+    "ingest.get_last_ingestion_date",
+    """SELECT start_time
+       FROM ingestion_jobs
+       WHERE status = 'completed' AND source_id = :source_id
+       ORDER BY start_time DESC
+       LIMIT 1""",
+    {"source_id": -1},
+    ["ix_ingestion_jobs_source_id_start_time_completed"],
+  ),
+  (
+    "prune.prune_old_content ratings of expired content",
+    """SELECT ucr.id
+       FROM user_content_ratings ucr
+       WHERE ucr.content_id IN (SELECT id FROM content WHERE date < CURRENT_DATE - INTERVAL '7 days' LIMIT 1000)""",
+    {},
+    ["ix_user_content_ratings_content_id_user_id"],
+  ),
+  (
+    "prune.prune_old_content expired content",
+    "SELECT id FROM content WHERE date < CURRENT_DATE - INTERVAL '7 days' ORDER BY id LIMIT 1000",
+    {},
+    ["ix_content_date"],
+  ),
+  (
+    "prune.prune_ingestion_logs",
+    "SELECT id FROM ingestion_jobs WHERE start_time < CURRENT_TIMESTAMP - INTERVAL '24 hours' ORDER BY id LIMIT 1000",
+    {},
+    ["ix_ingestion_jobs_start_time"],
+  ),
+  (
+    "user flavours of a user",
+    "SELECT id, nickname FROM user_flavours WHERE user_id = :user_id",
+    {"user_id": "explain_1"},
+    ["ix_user_flavours_user_id"],
+  ),
+]
+
+
+def get_index_names(plan: dict) -> set[str]:
+  names = {plan["Index Name"]} if "Index Name" in plan else set()
+  for child in plan.get("Plans", []):
+    names |= get_index_names(child)
+  return names
+
+
+async def main():
+  db = await database.get_db()
+  failures = 0
+  try:
+    async with db.connection():
+      transaction = await db.transaction()
+      try:
+        for query in SEED_QUERIES:
+          values = {"embed_dim": constants.EMBED_DIM} if ":embed_dim" in query else None
+          await db.execute(query, values)
+
+        # The seed is small, so only check that the planner is able to use the index for each predicate
+        await db.execute("SET LOCAL enable_seqscan = off")
+
+        for description, query, values, indexes in EXPECTED_PLANS:
+          result = await db.fetch_one(f"EXPLAIN (FORMAT JSON) {query}", values)
+          plan = json.loads(result[0])[0]["Plan"]
+          used = get_index_names(plan)
+          if used.intersection(indexes):
+            print(f"OK   {description}: {', '.join(sorted(used))}")
+          else:
+            failures += 1
+            print(f"FAIL {description}: expected one of {indexes}, plan used {sorted(used) or 'no index'}")
+      finally:
+        await transaction.rollback()
+  finally:
+    await database.close_db()
+
+  print(f"{len(EXPECTED_PLANS) - failures}/{len(EXPECTED_PLANS)} plans use their intended index")
+  if failures:
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  asyncio.run(main())
@@ -0,0 +1,90 @@
+"""
+Measure how long it takes to import the API and how much memory it holds before serving a request.
+
+Imports `src.server` in a fresh interpreter with `python -X importtime`, reports the slowest imports,
+and fails if the boot time or resident memory exceed their budgets or if a lazily loaded stack
+(visualization, ML, LLM SDK) is imported at startup.
+
+Run from the /server directory with `uv run -m benchmarks.importtime`
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+
+# Only needed by rarely used endpoints or offline jobs, so they must not be imported at boot
+LAZY_MODULES = ["sklearn", "plotly", "torch", "openai", "matplotlib"]
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def measure_importtime(module: str) -> list[tuple[int, int, int, str]]:
+  """Return (self us, cumulative us, depth, name) for every module imported by `import module`"""
+  result = subprocess.run(
+    [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True
+  )
+  imports = []
+  for line in result.stderr.splitlines():
+    match = IMPORTTIME_LINE.match(line)
+    if match:
+      self_us, cumulative_us, indent, name = match.groups()
+      imports.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+  return imports
+
+
+def measure_max_rss_mb(module: str) -> float:
+  """Return the peak resident memory in MB of a fresh interpreter after `import module`"""
+  result = subprocess.run(
+    [
+      sys.executable,
+      "-c",
+      f"import resource, {module}; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)",
+    ],
+    capture_output=True,
+    text=True,
+    check=True,
+  )
+  # ru_maxrss is reported in kilobytes on Linux
+  return int(result.stdout.strip().splitlines()[-1]) / 1024
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--module", default="src.server", help="Module to import")
+  parser.add_argument("--max-seconds", type=float, default=2.0, help="Budget for the total import time")
+  parser.add_argument("--max-rss-mb", type=float, default=250.0, help="Budget for the resident memory after import")
+  parser.add_argument("--top", type=int, default=15, help="Number of slowest top level imports to show")
+  args = parser.parse_args()
+
+  imports = measure_importtime(args.module)
+  total_seconds = sum(x[0] for x in imports) / 1e6
+  rss_mb = measure_max_rss_mb(args.module)
+
+  print(f"Slowest top level imports of {args.module}:")
+  top_level = sorted([x for x in imports if x[2] == 0], key=lambda x: x[1], reverse=True)
+  for _, cumulative_us, _, name in top_level[: args.top]:
+    print(f"  {cumulative_us / 1e3:8.1f} ms  {name}")
+
+  print(f"Total import time: {total_seconds:.2f}s (budget {args.max_seconds:.2f}s)")
+  print(f"Resident memory after import: {rss_mb:.0f} MB (budget {args.max_rss_mb:.0f} MB)")
+
+  imported = {x[3].split(".")[0] for x in imports}
+  eager = [x for x in LAZY_MODULES if x in imported]
+
+  failures = []
+  if total_seconds > args.max_seconds:
+    failures.append(f"import time {total_seconds:.2f}s exceeds {args.max_seconds:.2f}s")
+  if rss_mb > args.max_rss_mb:
+    failures.append(f"resident memory {rss_mb:.0f} MB exceeds {args.max_rss_mb:.0f} MB")
+  if eager:
+    failures.append(f"lazily loaded modules imported at startup: {', '.join(eager)}")
+
+  for failure in failures:
+    print(f"FAIL {failure}")
+  if failures:
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,100 @@
+"""
+Compare the single-pass item processing stage with the previous multi-pass pipeline.
+
+The previous pipeline ran bleach twice, parsed the description again with BeautifulSoup to find media, and
+built a lowercased copy of the title and description to detect the content type. Both are run over a corpus
+of captured feed items.
+
+Run from the /server directory with `uv run -m benchmarks.item_processing`, or capture a fresh corpus from the
+feeds in feeds.jsonc with `uv run -m benchmarks.item_processing --capture`
+"""
+
+import argparse
+import json
+import os
+import time
+import bleach
+import bs4
+import feedparser
+from jsmin import jsmin
+from src import items
+
+dirname = os.path.dirname(__file__)
+CORPUS_PATH = os.path.join(dirname, "data/feed_items.json")
+
+# Fields of a feed item that item processing reads
+CAPTURED_FIELDS = ["title", "link", "summary", "enclosures", "media_content", "media_medium"]
+
+
+def to_feed_item(data):
+  """Rebuild a feedparser item from its captured JSON, so attribute access works as it does during ingestion"""
+  if isinstance(data, dict):
+    return feedparser.FeedParserDict({key: to_feed_item(value) for key, value in data.items()})
+  if isinstance(data, list):
+    return [to_feed_item(x) for x in data]
+  return data
+
+
+def capture_corpus(items_per_feed: int):
+  with open(os.path.join(dirname, "../feeds.jsonc"), "r") as f:
+    feeds = json.loads(jsmin(f.read()))
+
+  corpus = []
+  for urls in feeds.values():
+    for url in urls or []:
+      print(f"Capturing {url}")
+      feed = feedparser.parse(url)
+      for entry in feed.entries[:items_per_feed]:
+        corpus.append({field: entry[field] for field in CAPTURED_FIELDS if field in entry})
+
+  with open(CORPUS_PATH, "w") as f:
+    json.dump(corpus, f, indent=2)
+  print(f"Captured {len(corpus)} items to {CORPUS_PATH}")
+
+
+def legacy_process_item(feed_item):
+  summary = feed_item.get("summary", "")
+  cleaned = bleach.clean(summary, tags=["p", "a", "br", "ul", "li", "strong", "em"], strip=True)
+  bleach.clean(summary, strip=True)
+
+  media = items.extract_feed_media(feed_item)
+  soup = bs4.BeautifulSoup(summary, "html.parser")
+  for img in soup.find_all("img"):
+    media.append({"type": "image", "url": img.get("src"), "source": "html_embed"})
+
+  content_type = items.detect_content_type(feed_item, summary)
+  return cleaned, media, content_type
+
+
+def run(name: str, process, corpus: list, repeat: int) -> float:
+  start = time.perf_counter()
+  for _ in range(repeat):
+    for feed_item in corpus:
+      process(feed_item)
+  elapsed = time.perf_counter() - start
+  count = len(corpus) * repeat
+  print(f"{name:>12}: {count / elapsed:10.0f} items/s ({elapsed * 1e6 / count:.0f} us per item)")
+  return elapsed
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--capture", action="store_true", help="Capture a new corpus from the feeds in feeds.jsonc")
+  parser.add_argument("--items-per-feed", type=int, default=10, help="Number of items to capture from each feed")
+  parser.add_argument("--repeat", type=int, default=50, help="Number of passes over the corpus")
+  args = parser.parse_args()
+
+  if args.capture:
+    capture_corpus(args.items_per_feed)
+
+  with open(CORPUS_PATH, "r") as f:
+    corpus = [to_feed_item(x) for x in json.load(f)]
+
+  print(f"Processing {len(corpus)} items {args.repeat} times with the {items.HTML_PARSER} parser")
+  legacy = run("legacy", legacy_process_item, corpus, args.repeat)
+  single_pass = run("single pass", items.process_item, corpus, args.repeat)
+  print(f"Single pass is {legacy / single_pass:.2f}x the speed of the legacy pipeline")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,74 @@
+"""
+Compare the rankers on the same candidate sets.
+
+Builds synthetic candidate sets shaped like the output of the retrieval stage: stories in clusters of
+near-duplicates around a reference embedding, sorted by distance. Every ranker ranks the same sets with
+the same seeds, and the speed, relevance and diversity of the resulting feeds are reported.
+
+Run from the /server directory with `uv run -m benchmarks.ranking`
+"""
+
+import argparse
+import copy
+import time
+import numpy as np
+from datetime import datetime, timedelta
+from src import constants, ranking, retrieval, vectors
+
+
+def make_candidates(rng: np.random.Generator, count: int, stories: int) -> list[retrieval.Candidate]:
+  reference = vectors.normalize(rng.standard_normal(constants.EMBED_DIM))
+  centers = vectors.normalize(reference + rng.standard_normal((stories, constants.EMBED_DIM)) * 0.04)
+  noise = rng.standard_normal((count, constants.EMBED_DIM)) * 0.005
+  embeddings = vectors.normalize(centers[rng.integers(stories, size=count)] + noise)
+
+  now = datetime.now()
+  candidates = [
+    retrieval.Candidate(
+      id=i,
+      date=now - timedelta(hours=float(rng.uniform(0, constants.MAX_CONTENT_AGE * 24))),
+      distance=float(np.linalg.norm(embedding - reference)),
+      embedding=embedding,
+    )
+    for i, embedding in enumerate(embeddings)
+  ]
+  candidates.sort(key=lambda x: x.distance)
+  return candidates
+
+
+def evaluate(ranker: ranking.Ranker, candidate_sets: list, count: int):
+  elapsed, distances, similarities = 0.0, [], []
+  for seed, candidates in enumerate(candidate_sets):
+    candidates = copy.deepcopy(candidates)
+    start = time.perf_counter()
+    ranked = ranker.rank(candidates, count, seed=seed)
+    elapsed += time.perf_counter() - start
+
+    embeddings = vectors.normalize(vectors.to_matrix([x.embedding for x in ranked]))
+    pairwise = embeddings @ embeddings.T
+    distances.append(np.mean([x.distance for x in ranked]))
+    similarities.append(pairwise[np.triu_indices(len(ranked), 1)].mean())
+
+  print(
+    f"{ranker.name:>8}: {elapsed * 1e3 / len(candidate_sets):6.2f} ms per feed, "
+    f"mean distance {np.mean(distances):.3f}, mean pairwise similarity {np.mean(similarities):.3f}"
+  )
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--feeds", type=int, default=200, help="Number of candidate sets to rank")
+  parser.add_argument("--candidates", type=int, default=100, help="Number of candidates per set")
+  parser.add_argument("--stories", type=int, default=25, help="Number of distinct stories per set")
+  args = parser.parse_args()
+
+  rng = np.random.default_rng(0)
+  candidate_sets = [make_candidates(rng, args.candidates, args.stories) for _ in range(args.feeds)]
+
+  print(f"Ranking {args.feeds} sets of {args.candidates} candidates into feeds of {constants.NUM_RECOMMENDATIONS}")
+  for ranker in ranking.RANKERS.values():
+    evaluate(ranker(), candidate_sets, constants.NUM_RECOMMENDATIONS)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,64 @@
+"""
+Compare the latency and results of the pgvector and in-memory retrieval engines.
+
+Runs the recommendation candidate search for a sample of users against the local database with both
+engines, and reports latency percentiles and how many of the pgvector results the in-memory engine returns.
+
+Run from the /server directory with `uv run -m benchmarks.retrieval`
+"""
+
+import argparse
+import asyncio
+import time
+import numpy as np
+from src import constants, database, retrieval, util
+
+
+async def measure(engine: retrieval.RetrievalEngine, users: list, max_distance: float, limit: int, repeat: int):
+  latencies = []
+  results = {}
+  for _ in range(repeat):
+    for user in users:
+      start = time.perf_counter()
+      candidates = await engine.search(user.id, user.embedding, max_distance, constants.MAX_CONTENT_AGE, [], limit)
+      latencies.append(time.perf_counter() - start)
+      results[user.id] = [x.id for x in candidates]
+
+  p50, p95 = np.percentile(latencies, [50, 95]) * 1e3
+  print(f"{engine.name:>8}: p50 {p50:7.2f} ms, p95 {p95:7.2f} ms over {len(latencies)} searches")
+  return results
+
+
+async def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--users", type=int, default=50, help="Number of users to search for")
+  parser.add_argument("--limit", type=int, default=100, help="Number of candidates per search")
+  parser.add_argument("--repeat", type=int, default=3, help="Number of passes over the users")
+  args = parser.parse_args()
+
+  db = await database.get_db()
+  try:
+    users = await db.fetch_all(database.users.select().where(database.users.c.embedding.is_not(None)).limit(args.users))
+    if not users:
+      print("No users with embeddings to search for")
+      return
+
+    max_distance = util.cosine_to_l2_distance(constants.MIN_SEARCH_COSINE_SIMILARITY)
+
+    memory = retrieval.InMemoryEngine()
+    start = time.perf_counter()
+    await memory.refresh()
+    print(f"Loaded {len(memory)} items into memory in {time.perf_counter() - start:.2f}s")
+
+    expected = await measure(retrieval.PgvectorEngine(), users, max_distance, args.limit, args.repeat)
+    actual = await measure(memory, users, max_distance, args.limit, args.repeat)
+
+    overlap = [len(set(expected[x]) & set(actual[x])) / len(expected[x]) for x in expected if expected[x]]
+    if overlap:
+      print(f"In-memory results contain {np.mean(overlap):.1%} of the pgvector results on average")
+  finally:
+    await database.close_db()
+
+
+if __name__ == "__main__":
+  asyncio.run(main())
@@ -3,19 +3,26 @@ from fastapi import HTTPException
 import httpx
 from clerk_backend_api import Clerk
 from clerk_backend_api.jwks_helpers import AuthStatus, AuthenticateRequestOptions
-from src import database
+from src import clients, database
 
 
 CLERK_SECRET_KEY = os.getenv("CLERK_SECRET_KEY")
 
+_clerk = None
 
-if not CLERK_SECRET_KEY:
-  raise ValueError("CLERK_SECRET_KEY is not set in environment variables")
+
+def get_clerk() -> Clerk:
+  """Get the shared Clerk client, creating it on first use"""
+  global _clerk
+  if _clerk is None:
+    if not CLERK_SECRET_KEY:
+      raise ValueError("CLERK_SECRET_KEY is not set in environment variables")
+    _clerk = Clerk(bearer_auth=CLERK_SECRET_KEY, client=clients.get_clerk_http_client())
+  return _clerk
 
 
 async def authenticate(request: httpx.Request):
-  sdk = Clerk(bearer_auth=CLERK_SECRET_KEY)
-  request_state = sdk.authenticate_request(request, AuthenticateRequestOptions())
+  request_state = get_clerk().authenticate_request(request, AuthenticateRequestOptions())
   if request_state.status == AuthStatus.SIGNED_OUT:
     raise HTTPException(status_code=401, detail="Unauthorized")
   sub = request_state.payload["sub"]
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import httpx
+from urllib.parse import urlparse
+from src import constants
+
+# Outbound clients are created on first use and shared by everything in the process, so connections are kept alive
+# between requests. Every client has explicit timeouts, so a hung server can't stall a worker or the ingester.
+HTTP_TIMEOUT = httpx.Timeout(constants.HTTP_TIMEOUT, connect=constants.HTTP_CONNECT_TIMEOUT)
+HTTP_LIMITS = httpx.Limits(
+  max_connections=constants.HTTP_MAX_CONNECTIONS,
+  max_keepalive_connections=constants.HTTP_MAX_CONNECTIONS,
+  keepalive_expiry=constants.HTTP_KEEPALIVE_EXPIRY,
+)
+USER_AGENT = "gourmet/0.1"
+
+# Responses that are worth retrying, anything else is returned or raised straight away
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_http_client: httpx.AsyncClient | None = None
+_host_semaphores: dict[str, asyncio.Semaphore] = {}
+_ollama_clients = {}
+_llm_client = None
+_clerk_http_client: httpx.Client | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+  """Get the shared client for fetching feeds and other plain HTTP requests"""
+  global _http_client
+  if _http_client is None:
+    _http_client = httpx.AsyncClient(
+      timeout=HTTP_TIMEOUT,
+      headers={"User-Agent": USER_AGENT},
+      follow_redirects=True,
+      # Retries connection failures, failed requests are retried with backoff by fetch
+      transport=httpx.AsyncHTTPTransport(limits=HTTP_LIMITS, retries=1),
+    )
+  return _http_client
+
+
+def get_host_semaphore(url: str) -> asyncio.Semaphore:
+  host = urlparse(url).netloc.lower()
+  if host not in _host_semaphores:
+    _host_semaphores[host] = asyncio.Semaphore(constants.HTTP_MAX_CONNECTIONS_PER_HOST)
+  return _host_semaphores[host]
+
+
+def get_retry_delay(response: httpx.Response | None, attempt: int) -> float:
+  """Wait for as long as the server asks in Retry-After, otherwise back off exponentially"""
+  retry_after = response.headers.get("Retry-After") if response is not None else None
+  if retry_after and retry_after.isdigit():
+    return min(float(retry_after), constants.HTTP_MAX_RETRY_DELAY)
+  return min(constants.HTTP_RETRY_BACKOFF * 2**attempt, constants.HTTP_MAX_RETRY_DELAY)
+
+
+async def fetch(url: str, headers: dict[str, str] | None = None) -> httpx.Response:
+  """
+  GET a URL with the shared client, limiting concurrent requests per host and retrying transient failures
+
+  Raises:
+      httpx.HTTPError: If the request still fails after HTTP_MAX_RETRIES retries, or returns an error status
+  """
+  client = get_http_client()
+  async with get_host_semaphore(url):
+    for attempt in range(constants.HTTP_MAX_RETRIES + 1):
+      response = None
+      try:
+        response = await client.get(url, headers=headers)
+        if response.status_code not in RETRY_STATUS_CODES:
+          response.raise_for_status()
+          return response
+      except httpx.TransportError as e:
+        if attempt == constants.HTTP_MAX_RETRIES:
+          raise
+        print(f"Request to {url} failed ({e!r}), retrying")
+
+      if attempt == constants.HTTP_MAX_RETRIES:
+        response.raise_for_status()
+      await asyncio.sleep(get_retry_delay(response, attempt))
+
+
+def get_ollama_client(host: str):
+  """Get the shared Ollama client for a host, importing the SDK on first use"""
+  if host not in _ollama_clients:
+    import ollama
+
+    # Embedding a batch can take a while when the model has to be loaded first
+    _ollama_clients[host] = ollama.AsyncClient(
+      host=host,
+      timeout=httpx.Timeout(constants.EMBED_TIMEOUT, connect=constants.HTTP_CONNECT_TIMEOUT),
+      transport=httpx.AsyncHTTPTransport(limits=HTTP_LIMITS, retries=constants.HTTP_MAX_RETRIES),
+    )
+  return _ollama_clients[host]
+
+
+def get_llm_client():
+  """Get the shared LLM client, importing the OpenAI SDK on first use"""
+  global _llm_client
+  if _llm_client is None:
+    from openai import AsyncOpenAI
+
+    # The SDK retries rate limits and server errors with backoff itself
+    _llm_client = AsyncOpenAI(
+      base_url=os.getenv("LLM_BASE_URL"),
+      api_key=os.getenv("LLM_API_KEY"),
+      timeout=httpx.Timeout(constants.LLM_TIMEOUT, connect=constants.HTTP_CONNECT_TIMEOUT),
+      max_retries=constants.HTTP_MAX_RETRIES,
+      http_client=httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT),
+    )
+  return _llm_client
+
+
+def get_clerk_http_client() -> httpx.Client:
+  """Get the client used by the Clerk SDK, which makes its requests synchronously"""
+  global _clerk_http_client
+  if _clerk_http_client is None:
+    _clerk_http_client = httpx.Client(
+      timeout=HTTP_TIMEOUT, transport=httpx.HTTPTransport(limits=HTTP_LIMITS, retries=constants.HTTP_MAX_RETRIES)
+    )
+  return _clerk_http_client
+
+
+async def close_clients():
+  """Close the shared clients and their connections"""
+  global _http_client, _llm_client, _clerk_http_client
+  if _http_client is not None:
+    await _http_client.aclose()
+  for client in _ollama_clients.values():
+    await client._client.aclose()
+  if _llm_client is not None:
+    await _llm_client.close()
+  if _clerk_http_client is not None:
+    _clerk_http_client.close()
+
+  _http_client = _llm_client = _clerk_http_client = None
+  _ollama_clients.clear()
+  _host_semaphores.clear()
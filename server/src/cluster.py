@@ -0,0 +1,76 @@
+import asyncio
+import numpy as np
+import sqlalchemy
+from datetime import datetime, timedelta
+from sklearn.cluster import KMeans
+from src import constants, database
+
+
+#
+#
+#
+def fit_clusters(embeddings: np.ndarray, cluster_count: int) -> tuple[np.ndarray, np.ndarray]:
+  """
+  Cluster the embeddings with k-means
+
+  Returns:
+      tuple: The cluster centroids and the cluster index of each embedding
+  """
+  kmeans = KMeans(n_clusters=min(cluster_count, len(embeddings)), n_init="auto", random_state=42)
+  labels = kmeans.fit_predict(embeddings)
+  return kmeans.cluster_centers_, labels
+
+
+async def update_content_clusters():
+  """Recompute the clusters of recent content and replace the stored clusters"""
+  db = await database.get_db()
+
+  rows = await db.fetch_all(
+    sqlalchemy.select(database.content.c.id, database.content.c.embedding).where(
+      (database.content.c.date >= datetime.now() - timedelta(days=constants.MAX_CONTENT_AGE))
+      & database.content.c.embedding.is_not(None)
+      & database.content.c.canonical_id.is_(None)
+    )
+  )
+  if not rows:
+    print("No recent content to cluster")
+    return 0
+
+  embeddings = np.array([x.embedding for x in rows], dtype=np.float32)
+  centroids, labels = fit_clusters(embeddings, constants.ONBOARDING_CLUSTER_COUNT)
+  sizes = np.bincount(labels, minlength=len(centroids))
+
+  async with db.transaction():
+    # Members are removed along with their clusters
+    await db.execute(database.content_clusters.delete())
+
+    cluster_ids = []
+    for centroid, size in zip(centroids, sizes):
+      cluster_id = await db.execute(
+        database.content_clusters.insert(), {"centroid": centroid.tolist(), "size": int(size)}
+      )
+      cluster_ids.append(cluster_id)
+
+    await db.execute(
+      """INSERT INTO content_cluster_members (content_id, cluster_id)
+         SELECT UNNEST(cast(:content_ids as int[])), UNNEST(cast(:cluster_ids as int[]))""",
+      {"content_ids": [x.id for x in rows], "cluster_ids": [cluster_ids[label] for label in labels]},
+    )
+
+  print(f"Clustered {len(rows)} content items into {len(centroids)} clusters")
+  return len(centroids)
+
+
+async def main():
+  try:
+    print("Starting content clustering")
+    await update_content_clusters()
+  except Exception as e:
+    print(f"Error clustering content: {e}")
+    raise
+  finally:
+    await database.close_db()
+
+
+if __name__ == "__main__":
+  asyncio.run(main())
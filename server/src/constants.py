@@ -7,6 +7,61 @@ SAMPLE_COUNT = 12  # Number of content ids to sample
 MIN_SEARCH_COSINE_SIMILARITY = 0.3  # Minimum cosine similarity for search
 MAX_ONBOARDING_COSINE_SIMILARITY = 0.15  # Maximum cosine similarity for onboarding
 MIN_FLAVOUR_COSINE_SIMILARITY = 0.45  # Minimum cosine similarity for flavours
+DUPLICATE_COSINE_SIMILARITY = 0.95  # Minimum cosine similarity for an item to be collapsed into an earlier story
+DUPLICATE_WINDOW = 3  # Days around an item's date that are searched for an earlier copy of the story
+EMBED_MODEL = "bge-m3"  # Embedding model, part of the embedding cache key
+EMBED_MAX_TOKENS = 512  # Budget of (whitespace separated) tokens of text sent to the embedding model per item
+EMBED_MAX_MODEL_TOKENS = 8192  # Context length of the embedding model, in model tokens
+EMBED_BATCH_SIZE = 32  # Number of texts sent to the embedder at once
+CONSTANTS_CACHE_TTL = 60  # Seconds that constants read from the database are cached for
+SOURCES_CACHE_TTL = 5 * 60  # Seconds that the source urls read from the database are cached for
+ONBOARDING_CLUSTER_COUNT = 48  # Number of k-means clusters to sample onboarding content from
+ONBOARDING_POOL_COUNT = 4  # Number of precomputed pools of mutually dissimilar onboarding content
+ONBOARDING_POOL_SIZE = 120  # Most items in each onboarding pool
+ONBOARDING_POOL_SAMPLE_SIZE = 5000  # Number of recent content items the onboarding pools are picked from
+ONBOARDING_POOL_REBUILD_INTERVAL = 60 * 60  # Minimum seconds between onboarding pool rebuilds by the ingester
+ONBOARDING_POOL_CACHE_TTL = 5 * 60  # Seconds that the onboarding pools read from the database are cached for
+INGESTION_LOCK_ID = 4242001  # Postgres advisory lock key held by the running ingester
+INGEST_MIN_POLL_INTERVAL = 10 * 60  # Seconds between polls of the most active sources
+INGEST_MAX_POLL_INTERVAL = 6 * 60 * 60  # Seconds between polls of the least active sources
+INGEST_DEFAULT_POLL_INTERVAL = 60 * 60  # Seconds between polls of sources without recent content
+INGEST_MAX_BACKOFF = 6 * 60 * 60  # Maximum seconds to wait before retrying a failing source
+SOURCE_DISABLE_AFTER_FAILURES = 10  # Consecutive failures after which a source is disabled
+SOURCE_REPROBE_INTERVAL = 24 * 60 * 60  # Seconds between probes of a disabled source
+INGEST_SCHEDULE_REFRESH = 60 * 60  # Seconds between recomputing the poll intervals from published content
+HTTP_TIMEOUT = 30  # Seconds to wait for outbound HTTP reads and writes
+HTTP_CONNECT_TIMEOUT = 5  # Seconds to wait for an outbound connection to be established
+HTTP_MAX_CONNECTIONS = 100  # Connections kept in each outbound client pool
+HTTP_MAX_CONNECTIONS_PER_HOST = 4  # Concurrent feed requests to a single host
+HTTP_KEEPALIVE_EXPIRY = 60  # Seconds an idle outbound connection is kept alive
+HTTP_MAX_RETRIES = 3  # Retries of failed outbound requests
+HTTP_RETRY_BACKOFF = 1  # Seconds before the first retry, doubled on each retry
+HTTP_MAX_RETRY_DELAY = 30  # Maximum seconds to wait before retrying an outbound request
+EMBED_TIMEOUT = 120  # Seconds to wait for a batch of embeddings from Ollama
+LLM_TIMEOUT = 60  # Seconds to wait for an LLM completion
+RETRIEVAL_REFRESH_INTERVAL = 60  # Seconds between polls for new content by the in-memory retrieval engine
+PROJECTION_DIM = 128  # Dimensions of the reduced embeddings used for the first pass of two-stage retrieval
+PROJECTION_OVERFETCH = 5  # Multiple of the needed candidates shortlisted by the first pass
+PROJECTION_SAMPLE_SIZE = 20000  # Number of recent content items the projection is fitted on
+PROJECTION_RECALL_K = 20  # k of the recall@k reported for a fitted projection
+RANK_MMR_LAMBDA = 0.7  # Trade-off between a candidate's score (1) and its novelty over the picked candidates (0)
+RANK_RECENCY_WEIGHT = 0.1  # Weight of the recency bonus in a candidate's ranking score
+RANK_EXPLORATION_NOISE = 0.05  # Standard deviation of the random noise added to ranking scores
+RANK_POPULARITY_WEIGHT = 0.1  # Weight of the content's popularity across all users in its ranking score
+POPULARITY_WINDOW = 24  # Hours of ratings counted by the recent window of the content popularity aggregates
+POPULARITY_PRIOR_COUNT = 5  # Neutral ratings blended into each popularity score, so a few ratings don't dominate
+POPULARITY_CACHE_TTL = 60  # Seconds that the popularity scores read from the database are cached for
+FANOUT_CHUNK_SIZE = 1000  # Users or flavours scored against new content at once by the fan-out
+FANOUT_MIN_COSINE_SIMILARITY = 0.5  # Minimum cosine similarity of new content to a user or flavour to be a fresh pick
+FANOUT_MAX_PICKS = 3  # Most fresh picks added for a user or flavour by one fan-out run
+FRESH_PICK_MAX_AGE = 24  # Hours that new content and its fresh picks are considered fresh
+FRESH_PICKS_PER_FEED = 3  # Most fresh picks merged into a feed
+FEED_PREFETCH_TTL = 30  # Seconds that a feed page computed ahead of its request is held for
+FEED_PREFETCH_MAX_ENTRIES = 1000  # Most feed pages held ahead of their request per process
+CONTENT_CACHE_SIZE = 10000  # Content rows (without embeddings) cached per process for hydrating feeds
+PRUNE_BATCH_SIZE = 1000  # Number of rows deleted per pruning batch
+PRUNE_BATCH_PAUSE = 0.5  # Seconds to wait between pruning batches
+EMBEDDING_CACHE_MAX_AGE = 30  # Days an unused embedding cache entry is kept for
 
 DB_CONSTANTS = {
   "EMBED_DIM": {
@@ -0,0 +1,143 @@
+import abc
+import asyncio
+import hashlib
+import os
+import numpy as np
+from src import clients, constants, vectors
+
+
+#
+#
+#
+class Embedder(abc.ABC):
+  """
+  Turns a batch of texts into an (n, EMBED_DIM) float32 matrix of unit length embeddings
+
+  model_name identifies the model in the embedding cache, backends that can produce different
+  vectors for the same text must use different names.
+  """
+
+  model_name: str
+  batch_size: int = constants.EMBED_BATCH_SIZE
+
+  @abc.abstractmethod
+  async def embed_batch(self, texts: list[str]) -> np.ndarray:
+    pass
+
+  async def embed(self, texts: list[str]) -> np.ndarray:
+    if not texts:
+      return np.empty((0, constants.EMBED_DIM), dtype=np.float32)
+
+    batches = [
+      await self.embed_batch(texts[start : start + self.batch_size]) for start in range(0, len(texts), self.batch_size)
+    ]
+    return vectors.normalize(np.concatenate(batches))
+
+
+class OllamaEmbedder(Embedder):
+  """Embeds with a model served by Ollama"""
+
+  def __init__(self, host: str, model: str = constants.EMBED_MODEL):
+    self.model_name = model
+    self.client = clients.get_ollama_client(host)
+
+  async def embed_batch(self, texts: list[str]) -> np.ndarray:
+    res = await self.client.embed(model=self.model_name, input=texts)
+    return vectors.to_matrix(res.embeddings)
+
+
+class OnnxEmbedder(Embedder):
+  """
+  Embeds in process with ONNX Runtime on the CPU
+
+  model_dir must contain an exported model.onnx and its tokenizer.json, e.g. an ONNX export of bge-m3.
+  The sentence embedding is the first token of the last hidden state (CLS pooling), as for bge-m3.
+  Requires the onnxruntime and tokenizers packages of the onnx extra.
+  """
+
+  def __init__(self, model_dir: str, model_name: str | None = None, threads: int | None = None):
+    try:
+      import onnxruntime
+      import tokenizers
+    except ImportError as e:
+      raise ImportError("The onnx embedder requires the onnx extra: uv sync --extra onnx") from e
+
+    self.model_name = model_name or f"onnx:{os.path.basename(os.path.normpath(model_dir))}"
+
+    self.tokenizer = tokenizers.Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+    self.tokenizer.enable_padding()
+    self.tokenizer.enable_truncation(max_length=constants.EMBED_MAX_MODEL_TOKENS)
+
+    options = onnxruntime.SessionOptions()
+    if threads:
+      options.intra_op_num_threads = threads
+    self.session = onnxruntime.InferenceSession(
+      os.path.join(model_dir, "model.onnx"), options, providers=["CPUExecutionProvider"]
+    )
+    self.input_names = {x.name for x in self.session.get_inputs()}
+
+  def run(self, texts: list[str]) -> np.ndarray:
+    encodings = self.tokenizer.encode_batch(texts)
+    inputs = {
+      "input_ids": np.array([x.ids for x in encodings], dtype=np.int64),
+      "attention_mask": np.array([x.attention_mask for x in encodings], dtype=np.int64),
+      "token_type_ids": np.array([x.type_ids for x in encodings], dtype=np.int64),
+    }
+    output = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+
+    # Models exported with pooling already return one vector per text
+    if output.ndim == 3:
+      output = output[:, 0]
+    return vectors.to_matrix(output)
+
+  async def embed_batch(self, texts: list[str]) -> np.ndarray:
+    # Inference releases the GIL, so it doesn't block the event loop while it runs
+    return await asyncio.to_thread(self.run, texts)
+
+
+class FakeEmbedder(Embedder):
+  """
+  Deterministic embeddings derived from a hash of the text, for benchmarks and offline runs
+
+  The same text always gets the same vector, but similar texts are not close to each other.
+  """
+
+  def __init__(self, dim: int = constants.EMBED_DIM):
+    self.dim = dim
+    self.model_name = f"fake:{dim}"
+
+  async def embed_batch(self, texts: list[str]) -> np.ndarray:
+    return vectors.to_matrix(
+      [
+        np.random.default_rng(int.from_bytes(hashlib.sha256(text.encode()).digest()[:8])).standard_normal(self.dim)
+        for text in texts
+      ]
+    )
+
+
+#
+#
+#
+_embedder: Embedder | None = None
+
+
+def create_embedder(backend: str) -> Embedder:
+  if backend == "ollama":
+    return OllamaEmbedder(os.getenv("OLLAMA_HOST", "http://localhost:11435"))
+  if backend == "onnx":
+    model_dir = os.getenv("ONNX_MODEL_DIR")
+    if not model_dir:
+      raise ValueError("ONNX_MODEL_DIR must be set to use the onnx embedder")
+    threads = os.getenv("ONNX_THREADS")
+    return OnnxEmbedder(model_dir, os.getenv("ONNX_MODEL_NAME"), int(threads) if threads else None)
+  if backend == "fake":
+    return FakeEmbedder()
+  raise ValueError(f"Unknown embedder backend: {backend}")
+
+
+def get_embedder() -> Embedder:
+  """Get the embedder selected by EMBEDDER_BACKEND (ollama, onnx or fake), created on first use"""
+  global _embedder
+  if _embedder is None:
+    _embedder = create_embedder(os.getenv("EMBEDDER_BACKEND", "ollama"))
+  return _embedder
@@ -0,0 +1,284 @@
+import asyncio
+import numpy as np
+import sqlalchemy
+from datetime import datetime, timedelta
+from src import constants, database, vectors
+
+
+#
+#
+#
+def score_chunk(embeddings: np.ndarray, items: np.ndarray, min_similarity: float, max_picks: int):
+  """
+  Match a chunk of user or flavour embeddings against the new items with one matrix product
+
+  Args:
+      embeddings: (n, EMBED_DIM) user or flavour embeddings
+      items: (m, EMBED_DIM) normalized item embeddings
+
+  Returns:
+      tuple: Row indexes into embeddings, column indexes into items and the cosine similarity of each match,
+      for up to max_picks matches of at least min_similarity per row
+  """
+  similarities = vectors.normalize(embeddings) @ items.T
+  k = min(max_picks, items.shape[0])
+  if items.shape[0] > k:
+    top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+  else:
+    top = np.broadcast_to(np.arange(items.shape[0]), (len(embeddings), items.shape[0]))
+  scores = np.take_along_axis(similarities, top, axis=1)
+  rows, columns = np.nonzero(scores >= min_similarity)
+  return rows, top[rows, columns], scores[rows, columns]
+
+
+async def iter_embedding_chunks(chunk_size: int):
+  """
+  Stream the embeddings of all users and flavours in chunks, so memory stays bounded however many there are
+
+  Yields:
+      tuple: The (user_id, flavour_id) of each row, flavour_id None for a user's main feed, and their embeddings
+  """
+  db = await database.get_db()
+
+  last_user_id = ""
+  while True:
+    rows = await db.fetch_all(
+      sqlalchemy.select(database.users.c.id, database.users.c.embedding)
+      .where(database.users.c.embedding.is_not(None) & (database.users.c.id > last_user_id))
+      .order_by(database.users.c.id)
+      .limit(chunk_size)
+    )
+    if not rows:
+      break
+    yield [(x.id, None) for x in rows], vectors.to_matrix([x.embedding for x in rows])
+    last_user_id = rows[-1].id
+
+  flavours = database.user_flavours
+  last_flavour_id = 0
+  while True:
+    rows = await db.fetch_all(
+      sqlalchemy.select(flavours.c.id, flavours.c.user_id, flavours.c.embedding)
+      .where(flavours.c.embedding.is_not(None) & (flavours.c.id > last_flavour_id))
+      .order_by(flavours.c.id)
+      .limit(chunk_size)
+    )
+    if not rows:
+      break
+    yield [(x.user_id, x.id) for x in rows], vectors.to_matrix([x.embedding for x in rows])
+    last_flavour_id = rows[-1].id
+
+
+#
+#
+#
+async def start_fanout_run():
+  """Start a fan-out run over the content added since the last completed one, None if there is no new content"""
+  db = await database.get_db()
+  return await db.fetch_one(
+    """WITH bounds AS (
+         SELECT
+           (SELECT COALESCE(MAX(max_content_id), 0) FROM fanout_runs WHERE status = 'completed') AS min_content_id,
+           (SELECT MAX(id) FROM content) AS max_content_id
+       )
+       INSERT INTO fanout_runs (status, max_content_id)
+       SELECT 'running', max_content_id FROM bounds WHERE max_content_id > min_content_id
+       RETURNING *, (SELECT min_content_id FROM bounds) AS min_content_id"""
+  )
+
+
+async def complete_fanout_run(run_id: int, success: bool = True, error_message: str = None):
+  """Mark a fan-out run as completed or failed and return its final statistics"""
+  db = await database.get_db()
+  status = "completed" if success else "failed"
+  return await db.fetch_one(
+    """UPDATE fanout_runs
+       SET finished_at = CURRENT_TIMESTAMP, status = :status, error_message = :error_message
+       WHERE id = :run_id
+       RETURNING *""",
+    {"status": status, "error_message": error_message, "run_id": run_id},
+  )
+
+
+async def get_new_items(min_content_id: int, max_content_id: int):
+  """Get the ids and normalized embeddings of the fresh canonical content in (min_content_id, max_content_id]"""
+  db = await database.get_db()
+  rows = await db.fetch_all(
+    sqlalchemy.select(database.content.c.id, database.content.c.embedding)
+    .where(
+      (database.content.c.id > min_content_id)
+      & (database.content.c.id <= max_content_id)
+      & (database.content.c.date >= datetime.now() - timedelta(hours=constants.FRESH_PICK_MAX_AGE))
+      & database.content.c.embedding.is_not(None)
+      & database.content.c.canonical_id.is_(None)
+    )
+    .order_by(database.content.c.id)
+  )
+  ids = np.array([x.id for x in rows], dtype=np.int64)
+  return ids, vectors.normalize(vectors.to_matrix([x.embedding for x in rows]))
+
+
+async def add_fresh_picks(run_id: int, picks: list[tuple], scored: int) -> int:
+  """Add (user_id, flavour_id, content_id, score) picks to the inboxes, skipping ones that are already there"""
+  db = await database.get_db()
+  result = await db.fetch_one(
+    """WITH inserted AS (
+         INSERT INTO fresh_picks (user_id, flavour_id, content_id, score)
+         SELECT * FROM UNNEST(
+           cast(:user_ids as text[]),
+           cast(:flavour_ids as int[]),
+           cast(:content_ids as int[]),
+           cast(:scores as float8[])
+         )
+         ON CONFLICT (user_id, (COALESCE(flavour_id, 0)), content_id) DO NOTHING
+         RETURNING 1
+       )
+       UPDATE fanout_runs
+       SET embeddings_scored = embeddings_scored + :scored, picks_added = picks_added + (SELECT COUNT(*) FROM inserted)
+       WHERE id = :run_id
+       RETURNING (SELECT COUNT(*) FROM inserted) AS count""",
+    {
+      "user_ids": [x[0] for x in picks],
+      "flavour_ids": [x[1] for x in picks],
+      "content_ids": [x[2] for x in picks],
+      "scores": [x[3] for x in picks],
+      "scored": scored,
+      "run_id": run_id,
+    },
+  )
+  return result["count"]
+
+
+async def delete_expired_picks() -> int:
+  db = await database.get_db()
+  return await db.fetch_val(
+    """WITH deleted AS (
+         DELETE FROM fresh_picks
+         WHERE created_at < CURRENT_TIMESTAMP - make_interval(hours => :max_age)
+         RETURNING 1
+       )
+       SELECT COUNT(*) FROM deleted""",
+    {"max_age": constants.FRESH_PICK_MAX_AGE},
+  )
+
+
+async def fan_out_new_content():
+  """
+  Score the content added since the last run against every user and flavour, and add the best matches of
+  each to their fresh picks
+  """
+  expired = await delete_expired_picks()
+  run = await start_fanout_run()
+  if run is None:
+    return
+  try:
+    ids, items = await get_new_items(run["min_content_id"], run["max_content_id"])
+    if not len(ids):
+      await complete_fanout_run(run["id"])
+      return
+
+    db = await database.get_db()
+    await db.execute(
+      "UPDATE fanout_runs SET items_scored = :count WHERE id = :run_id", {"count": len(ids), "run_id": run["id"]}
+    )
+
+    async for feeds, embeddings in iter_embedding_chunks(constants.FANOUT_CHUNK_SIZE):
+      rows, columns, scores = score_chunk(
+        embeddings, items, constants.FANOUT_MIN_COSINE_SIMILARITY, constants.FANOUT_MAX_PICKS
+      )
+      picks = [(*feeds[row], int(ids[column]), float(score)) for row, column, score in zip(rows, columns, scores)]
+      await add_fresh_picks(run["id"], picks, len(feeds))
+
+    stats = await complete_fanout_run(run["id"])
+    print(
+      f"Fanned out {stats['items_scored']} new items to {stats['embeddings_scored']} users and flavours: "
+      f"added {stats['picks_added']} fresh picks, expired {expired}"
+    )
+  except Exception as e:
+    await complete_fanout_run(run["id"], success=False, error_message=str(e))
+    raise
+
+
+#
+#
+#
+async def take_fresh_picks(
+  user_id: str, flavour_ids: list[int | None], ignored_ids: list[int] | None, limit: int, remove: bool = True
+) -> dict[int | None, list[int]]:
+  """
+  Take the best fresh picks of several feeds of a user out of their inbox
+
+  Picks of content that is in ignored_ids or that the user has rated are left in place. With remove False the
+  picks are only read, for pages computed ahead of their request, and remove_fresh_picks removes them once the
+  page is served.
+
+  Returns:
+      dict: The content ids of up to limit picks of each feed, keyed by flavour id (None for the main feed),
+      best first
+  """
+  if remove:
+    statement = """DELETE FROM fresh_picks fp
+       USING picked p
+       WHERE fp.id = p.id
+       RETURNING fp.flavour_id, fp.content_id, fp.score"""
+  else:
+    statement = "SELECT flavour_id, content_id, score FROM picked"
+
+  db = await database.get_db()
+  rows = await db.fetch_all(
+    f"""WITH picked AS (
+         SELECT id, flavour_id, content_id, score
+         FROM (
+           SELECT
+             fp.id, fp.flavour_id, fp.content_id, fp.score,
+             ROW_NUMBER() OVER (PARTITION BY COALESCE(fp.flavour_id, 0) ORDER BY fp.score DESC) AS position
+           FROM fresh_picks fp
+           WHERE fp.user_id = :user_id
+           AND COALESCE(fp.flavour_id, 0) = ANY(cast(:flavour_keys as int[]))
+           AND fp.created_at >= CURRENT_TIMESTAMP - make_interval(hours => :max_age)
+           AND fp.content_id NOT IN (SELECT UNNEST(cast(:ignored_ids as int[])))
+           AND NOT EXISTS (
+             SELECT 1 FROM user_content_ratings ucr WHERE ucr.user_id = fp.user_id AND ucr.content_id = fp.content_id
+           )
+         ) ranked
+         WHERE position <= :limit
+       )
+       {statement}""",
+    {
+      "user_id": user_id,
+      "flavour_keys": [x or 0 for x in flavour_ids],
+      "max_age": constants.FRESH_PICK_MAX_AGE,
+      "ignored_ids": ignored_ids,
+      "limit": limit,
+    },
+  )
+
+  picks = {flavour_id: [] for flavour_id in flavour_ids}
+  for x in sorted(rows, key=lambda x: -x.score):
+    picks[x.flavour_id].append(x.content_id)
+  return picks
+
+
+async def remove_fresh_picks(user_id: str, flavour_id: int | None, content_ids: list[int]):
+  """Remove the picks of content that has been shown in a feed from the user's inbox"""
+  db = await database.get_db()
+  await db.execute(
+    """DELETE FROM fresh_picks
+       WHERE user_id = :user_id
+       AND COALESCE(flavour_id, 0) = :flavour_key
+       AND content_id IN (SELECT UNNEST(cast(:content_ids as int[])))""",
+    {"user_id": user_id, "flavour_key": flavour_id or 0, "content_ids": content_ids},
+  )
+
+
+async def main():
+  try:
+    await fan_out_new_content()
+  except Exception as e:
+    print(f"Error fanning out new content: {e}")
+    raise
+  finally:
+    await database.close_db()
+
+
+if __name__ == "__main__":
+  asyncio.run(main())
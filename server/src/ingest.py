@@ -1,113 +1,126 @@
-import os
-import torch
+import sys
+import time
+import signal
+import numpy as np
 import asyncio
 import feedparser
 import datetime
 import asyncpg
-import ollama
-import bs4
-import bleach
-from typing import Literal
+import hashlib
+import sqlalchemy
+from sqlalchemy.dialects import postgresql
+from typing import NamedTuple
 
-from src import database
+from src import clients, constants, database, embedders, fanout, items, onboarding, util
 
-ollama_client = ollama.Client(host=os.getenv("OLLAMA_HOST", "http://localhost:11435"))
+
+class PreparedItem(NamedTuple):
+  feed_item: feedparser.FeedParserDict
+  processed: items.ProcessedItem
+  embedding_input: items.EmbeddingInput
 
 
 #
 #
 #
-def get_content_embedding(feed_item: feedparser.FeedParserDict) -> torch.Tensor:
-  text = feed_item.title + ": " + feed_item.summary
-
-  res = ollama_client.embed(model="bge-m3", input=text)
-
-  embedding = torch.tensor(res.embeddings[0])
-
-  return embedding
-
-
-def clean_description(description: str) -> str:
-  # Allow only safe HTML tags (e.g., <p>, <a>, <img>)
-  allowed_tags = ["p", "a", "br", "ul", "li", "strong", "em"]
-  cleaned = bleach.clean(description, tags=allowed_tags, strip=True)
-
-  # Extract text-only alternative
-  text_only = bleach.clean(description, strip=True)
+def get_embedding_cache_key(model: str, text: str) -> str:
+  return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
 
-  return cleaned, text_only
 
+async def get_cached_embeddings(keys: list[str]) -> dict[str, np.ndarray]:
+  """Get the embeddings that are in the cache, marking them as used"""
+  db = await database.get_db()
+  results = await db.fetch_all(
+    database.embedding_cache.update()
+    .where(database.embedding_cache.c.key.in_(keys))
+    .values(last_used_at=sqlalchemy.func.now())
+    .returning(database.embedding_cache.c.key, database.embedding_cache.c.embedding)
+  )
+  return {result.key: result.embedding for result in results}
 
-def extract_media(feed_item: feedparser.FeedParserDict) -> list[dict[str, str]]:
-  media = []
 
-  # 1. Check RSS enclosures (podcasts/images)
-  for enclosure in getattr(feed_item, "enclosures", []):
-    media.append(
-      {
-        "type": enclosure.type.split("/")[0],  # 'image', 'audio', etc.
-        "url": enclosure.href,
-        "source": "enclosure",
-      }
-    )
-
-  # 2. Check Media RSS
-  if hasattr(feed_item, "media_content"):
-    for mc in feed_item.media_content:
-      media.append({"type": mc.get("medium", mc.type.split("/")[0]), "url": mc["url"], "source": "media_rss"})
+async def cache_embeddings(keys: list[str], model: str, embeddings: np.ndarray):
+  db = await database.get_db()
+  await db.execute(
+    postgresql.insert(database.embedding_cache)
+    .values([{"key": key, "model": model, "embedding": embedding.tolist()} for key, embedding in zip(keys, embeddings)])
+    .on_conflict_do_nothing(index_elements=["key"])
+  )
 
-  # 3. Scrape HTML description for embedded media
-  soup = bs4.BeautifulSoup(feed_item.description, "html.parser")
-  for img in soup.find_all("img"):
-    media.append({"type": "image", "url": img.get("src"), "source": "html_embed"})
 
-  return media
+async def get_embeddings(texts: list[str]) -> tuple[list[np.ndarray], list[bool]]:
+  """
+  Get the embeddings of the texts, embedding the ones that aren't in the embedding cache in batches
 
+  Returns:
+      tuple: The embeddings and whether each came from the cache
+  """
+  embedder = embedders.get_embedder()
+  keys = [get_embedding_cache_key(embedder.model_name, text) for text in texts]
+  cached = await get_cached_embeddings(keys) if keys else {}
 
-ContentType = Literal["audio", "video", "article", "unknown"]
+  # The same text can appear more than once in a feed, only embed it once
+  missing = list(dict.fromkeys(key for key in keys if key not in cached))
+  if missing:
+    text_by_key = dict(zip(keys, texts))
+    embedded = await embedder.embed([text_by_key[key] for key in missing])
+    await cache_embeddings(missing, embedder.model_name, embedded)
+    cached.update(zip(missing, embedded))
 
+  return [cached[key] for key in keys], [key not in missing for key in keys]
 
-def detect_content_type(feed_item: feedparser.FeedParserDict) -> ContentType:
-  # Initialize type counters
-  type_counts = {"audio": 0, "video": 0, "article": 0}
 
-  # Priority 1: Check RSS/Media-RSS explicit tags
-  if hasattr(feed_item, "media_medium"):
-    if feed_item.media_medium == "audio":
-      type_counts["audio"] += 2
-    elif feed_item.media_medium == "video":
-      type_counts["video"] += 2
+async def find_canonical_content(embedding: np.ndarray, date: datetime.datetime) -> int | None:
+  """Find an earlier copy of the same story from around the same date, to collapse the item into"""
+  # The bounds are computed here, Postgres can't infer the type of a parameter in `:date - interval`
+  window = datetime.timedelta(days=constants.DUPLICATE_WINDOW)
+  db = await database.get_db()
+  result = await db.fetch_one(
+    """SELECT id, embedding <-> :embedding AS distance
+       FROM content
+       WHERE canonical_id IS NULL
+       AND date BETWEEN :start_date AND :end_date
+       ORDER BY embedding <-> :embedding
+       LIMIT 1""",
+    {
+      "embedding": util.list_to_string(embedding),
+      "start_date": date - window,
+      "end_date": date + window,
+    },
+  )
+  if result and result["distance"] < util.cosine_to_l2_distance(constants.DUPLICATE_COSINE_SIMILARITY):
+    return result["id"]
+  return None
 
-  # Priority 2: Analyze enclosures
-  for enc in getattr(feed_item, "enclosures", []):
-    if enc.type.startswith("audio/"):
-      type_counts["audio"] += 1
-      break  # Only count once per type
-    elif enc.type.startswith("video/"):
-      type_counts["video"] += 1
-      break
 
-  # Priority 3: Heuristics (title/description/category)
-  text = (feed_item.title + " " + feed_item.description).lower()
-  if "podcast" in text or "episode" in text:
-    type_counts["audio"] += 1
-  elif "video" in text or "watch" in text:
-    type_counts["video"] += 1
+#
+#
+#
+def prepare_feed_item(feed_item: feedparser.FeedParserDict) -> PreparedItem:
+  processed = items.process_item(feed_item)
+  embedding_input = items.get_embedding_input(feed_item.title, processed.text)
+  return PreparedItem(feed_item, processed, embedding_input)
 
-  # Determine final type based on majority
-  max_count = max(type_counts.values())
-  if max_count >= 2:
-    return max(type_counts, key=type_counts.get)
 
-  # Default to article if no clear majority
-  return "article" if not getattr(feed_item, "enclosures", []) else "unknown"
+async def process_feed_item(source_id: int, item: PreparedItem, embedding: np.ndarray, cache_hit: bool, job_id: int):
+  feed_item, processed, embedding_input = item
 
+  # Only text that was actually sent to the embedding model counts towards the job's input tokens
+  db = await database.get_db()
+  await db.execute(
+    """UPDATE ingestion_jobs
+       SET embedding_input_tokens = embedding_input_tokens + :tokens,
+           embedding_cache_hits = embedding_cache_hits + :hits,
+           embedding_cache_misses = embedding_cache_misses + :misses
+       WHERE id = :job_id""",
+    {
+      "tokens": 0 if cache_hit else embedding_input.tokens,
+      "hits": int(cache_hit),
+      "misses": int(not cache_hit),
+      "job_id": job_id,
+    },
+  )
 
-#
-#
-#
-async def process_feed_item(source_id: int, feed_item: feedparser.FeedParserDict, job_id: int):
-  embedding = get_content_embedding(feed_item)
   published_date = None
   if "published_parsed" in feed_item:
     published_date = datetime.datetime(*feed_item.published_parsed[:6])
@@ -117,23 +130,25 @@ async def process_feed_item(source_id: int, feed_item: feedparser.FeedParserDict
     print(f"WARNING: No date found for {feed_item.link}")
     published_date = datetime.datetime.now()
 
-  media = extract_media(feed_item)
-  content_type = detect_content_type(feed_item)
-  summary_html, _ = clean_description(feed_item.summary) if hasattr(feed_item, "summary") else ("", "")
+  url = items.canonicalize_url(feed_item.link)
+  canonical_id = await find_canonical_content(embedding, published_date)
+  if canonical_id:
+    print(f"Collapsing {url} into near-duplicate content {canonical_id}")
 
-  db = await database.get_db()
   try:
     await db.execute(
       database.content.insert(),
       {
         "title": feed_item.title,
-        "url": feed_item.link,
-        "description": summary_html,
+        "url": url,
+        "description": processed.html,
         "source_id": source_id,
         "date": published_date,
         "embedding": embedding.tolist(),
-        "media": media,
-        "content_type": content_type,
+        "media": processed.media,
+        "content_type": processed.content_type,
+        "embedding_input_tokens": embedding_input.tokens,
+        "canonical_id": canonical_id,
       },
     )
     await db.execute(
@@ -152,17 +167,20 @@ async def process_feed_item(source_id: int, feed_item: feedparser.FeedParserDict
 #
 #
 async def get_last_ingestion_date(source_id: int):
-  """Get the start time of the last successful ingestion job for a specific source"""
+  """
+  Get the start time of the last successful poll of a specific source
+
+  Read from the source's health rather than its ingestion jobs, which are pruned long before a source that is
+  backing off or disabled is polled again. Sources without a recorded success fall back to their last completed job.
+  """
   db = await database.get_db()
-  result = await db.fetch_one(
-    """SELECT start_time
-       FROM ingestion_jobs
-       WHERE status = 'completed' AND source_id = :source_id
-       ORDER BY start_time DESC
-       LIMIT 1""",
+  return await db.fetch_val(
+    """SELECT COALESCE(
+         (SELECT last_success_at FROM source_health WHERE source_id = :source_id),
+         (SELECT MAX(start_time) FROM ingestion_jobs WHERE status = 'completed' AND source_id = :source_id)
+       )""",
     {"source_id": source_id},
   )
-  return result["start_time"] if result else None
 
 
 #
@@ -188,13 +206,14 @@ async def create_ingestion_job(source_id: int):
 
 
 async def complete_ingestion_job(job_id: int, success: bool = True, error_message: str = None):
-  """Mark an ingestion job as completed or failed"""
+  """Mark an ingestion job as completed or failed and return its statistics"""
   db = await database.get_db()
   status = "completed" if success else "failed"
-  await db.execute(
+  return await db.fetch_one(
     """UPDATE ingestion_jobs
        SET end_time = :end_time, status = :status, error_message = :error_message
-       WHERE id = :job_id""",
+       WHERE id = :job_id
+       RETURNING items_processed, items_added, embedding_input_tokens, embedding_cache_hits, embedding_cache_misses""",
     {"end_time": datetime.datetime.now(), "status": status, "error_message": error_message, "job_id": job_id},
   )
 
@@ -205,8 +224,12 @@ async def complete_ingestion_job(job_id: int, success: bool = True, error_messag
 async def feed_ingestion(feed_id: int, feed_url: str, job_id: int, last_ingestion_date: datetime.datetime = None):
   try:
     print(f"Ingesting feed {feed_url}")
-    feed = feedparser.parse(feed_url)
-    items_processed = 0
+    response = await clients.fetch(feed_url)
+    # Let feedparser resolve relative links against the final URL after redirects
+    feed = feedparser.parse(
+      response.content, response_headers={**response.headers, "content-location": str(response.url)}
+    )
+    prepared = []
     for entry in feed.entries:
       entry_date = None
       if "published_parsed" in entry:
@@ -216,8 +239,13 @@ async def feed_ingestion(feed_id: int, feed_url: str, job_id: int, last_ingestio
       if last_ingestion_date and entry_date and entry_date <= last_ingestion_date:
         print(f"Skipping {entry.link} - older than last ingestion")
         continue
-      await process_feed_item(feed_id, entry, job_id)
-      items_processed += 1
+      prepared.append(prepare_feed_item(entry))
+
+    # Embed the whole feed at once, so the embedder can batch the items
+    embeddings, cache_hits = await get_embeddings([item.embedding_input.text for item in prepared])
+    for item, embedding, cache_hit in zip(prepared, embeddings, cache_hits):
+      await process_feed_item(feed_id, item, embedding, cache_hit, job_id)
+    items_processed = len(prepared)
     db = await database.get_db()
     await db.execute(
       """UPDATE ingestion_jobs
@@ -234,31 +262,302 @@ async def feed_ingestion(feed_id: int, feed_url: str, job_id: int, last_ingestio
 #
 #
 #
-async def main():
+async def ingest_source(source) -> int:
+  """Run an ingestion job for a single source, returning the number of items processed"""
+  job_id = await create_ingestion_job(source.id)
   try:
-    print("Starting ingestion pipeline")
-    db = await database.get_db()
-    sources = await db.fetch_all(database.sources.select())
-    total_processed = 0
+    print(f"Starting ingestion job {job_id} for source {source.url}")
+    last_ingestion_date = await get_last_ingestion_date(source.id)
+    if last_ingestion_date:
+      print(f"Only processing items newer than {last_ingestion_date}")
+    processed = await feed_ingestion(source.id, source.url, job_id, last_ingestion_date)
+    stats = await complete_ingestion_job(job_id, success=True)
+    lookups = stats["embedding_cache_hits"] + stats["embedding_cache_misses"]
+    hit_rate = f"{stats['embedding_cache_hits'] / lookups:.0%}" if lookups else "n/a"
+    print(
+      f"Completed ingestion job {job_id}: added {stats['items_added']} of {stats['items_processed']} items, "
+      f"embedded {stats['embedding_input_tokens']} tokens, embedding cache hit rate {hit_rate}"
+    )
+    return processed
+  except Exception as e:
+    print(f"Error processing source {source.url}: {e}")
+    await complete_ingestion_job(job_id, success=False, error_message=str(e))
+    raise
+
+
+async def fan_out_new_content():
+  """Add the content ingested since the last fan-out to the fresh picks of matching users, without failing the run"""
+  try:
+    await fanout.fan_out_new_content()
+  except Exception as e:
+    print(f"Error fanning out new content: {e}")
+
+
+async def refresh_onboarding_pools(max_interval: float = 0):
+  """Rebuild the onboarding pools from the content ingested so far, without failing the run"""
+  try:
+    await onboarding.refresh_pools(max_interval=max_interval)
+  except Exception as e:
+    print(f"Error building onboarding pools: {e}")
+
+
+async def try_acquire_ingestion_lock() -> bool:
+  """
+  Try to take the session level advisory lock that makes sure only one ingester runs at a time
+
+  The caller must hold a connection (`async with db.connection()`) for as long as the lock is needed.
+  """
+  db = await database.get_db()
+  result = await db.fetch_one(
+    "SELECT pg_try_advisory_lock(:lock_id) AS locked", {"lock_id": constants.INGESTION_LOCK_ID}
+  )
+  return result["locked"]
+
+
+async def release_ingestion_lock():
+  db = await database.get_db()
+  await db.execute("SELECT pg_advisory_unlock(:lock_id)", {"lock_id": constants.INGESTION_LOCK_ID})
+
+
+async def get_source_poll_intervals() -> dict[int, float]:
+  """
+  Get the number of seconds to wait between polls of each source
+
+  The interval is half of the median gap between the items a source published recently, clamped to
+  between INGEST_MIN_POLL_INTERVAL and INGEST_MAX_POLL_INTERVAL. Sources without enough recent content
+  are not included.
+  """
+  db = await database.get_db()
+  rows = await db.fetch_all(
+    """SELECT source_id, percentile_cont(0.5) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM gap)) AS median_gap
+       FROM (
+         SELECT source_id, date - LAG(date) OVER (PARTITION BY source_id ORDER BY date) AS gap
+         FROM content
+         WHERE date >= CURRENT_TIMESTAMP - make_interval(days => :max_content_age)
+       ) gaps
+       WHERE gap IS NOT NULL
+       GROUP BY source_id""",
+    {"max_content_age": constants.MAX_CONTENT_AGE},
+  )
+  return {
+    x["source_id"]: min(
+      max(x["median_gap"] / 2, constants.INGEST_MIN_POLL_INTERVAL), constants.INGEST_MAX_POLL_INTERVAL
+    )
+    for x in rows
+  }
+
+
+#
+#
+#
+async def get_sources_with_health(eligible_only: bool = False):
+  """Get all sources along with their health, optionally only those that are due to be polled"""
+  db = await database.get_db()
+  return await db.fetch_all(
+    f"""SELECT s.id, s.url, s.source_type,
+              COALESCE(h.consecutive_failures, 0) AS consecutive_failures,
+              h.last_success_at, h.last_failure_at, h.last_error, h.next_eligible_at, h.disabled_at
+       FROM sources s
+       LEFT JOIN source_health h ON h.source_id = s.id
+       {"WHERE h.next_eligible_at IS NULL OR h.next_eligible_at <= CURRENT_TIMESTAMP" if eligible_only else ""}
+       ORDER BY s.id"""
+  )
+
+
+async def record_source_success(source_id: int, polled_at: datetime.datetime):
+  """Record a successful poll of a source that started at polled_at, the cutoff for the items of its next poll"""
+  db = await database.get_db()
+  await db.execute(
+    """INSERT INTO source_health (source_id, consecutive_failures, last_success_at)
+       VALUES (:source_id, 0, :polled_at)
+       ON CONFLICT (source_id) DO UPDATE SET
+           consecutive_failures = 0,
+           last_success_at = EXCLUDED.last_success_at,
+           next_eligible_at = NULL,
+           disabled_at = NULL""",
+    {"source_id": source_id, "polled_at": polled_at},
+  )
+
+
+def get_backoff(failures: int) -> float:
+  """Seconds to wait before retrying a source that failed `failures` times in a row"""
+  if failures >= constants.SOURCE_DISABLE_AFTER_FAILURES:
+    return constants.SOURCE_REPROBE_INTERVAL
+  return min(constants.INGEST_MIN_POLL_INTERVAL * 2 ** (failures - 1), constants.INGEST_MAX_BACKOFF)
+
+
+async def record_source_failure(source_id: int, error_message: str) -> float:
+  """
+  Record a failed poll of a source and back it off exponentially
+
+  Sources that fail SOURCE_DISABLE_AFTER_FAILURES times in a row are disabled, and only probed again
+  every SOURCE_REPROBE_INTERVAL seconds until they succeed.
+
+  Returns:
+      float: Seconds until the source may be polled again
+  """
+  db = await database.get_db()
+  result = await db.fetch_one(
+    """INSERT INTO source_health (source_id, consecutive_failures, last_failure_at, last_error)
+       VALUES (:source_id, 1, CURRENT_TIMESTAMP, :error_message)
+       ON CONFLICT (source_id) DO UPDATE SET
+           consecutive_failures = source_health.consecutive_failures + 1,
+           last_failure_at = EXCLUDED.last_failure_at,
+           last_error = EXCLUDED.last_error
+       RETURNING consecutive_failures""",
+    {"source_id": source_id, "error_message": error_message},
+  )
+  failures = result["consecutive_failures"]
+  backoff = get_backoff(failures)
+  disabled = failures >= constants.SOURCE_DISABLE_AFTER_FAILURES
+  await db.execute(
+    """UPDATE source_health
+       SET next_eligible_at = CURRENT_TIMESTAMP + make_interval(secs => :backoff),
+           disabled_at = CASE WHEN :disabled THEN COALESCE(disabled_at, CURRENT_TIMESTAMP) END
+       WHERE source_id = :source_id""",
+    {"source_id": source_id, "backoff": backoff, "disabled": disabled},
+  )
+  state = "disabled" if disabled else "backing off"
+  print(f"Source {source_id} failed {failures} times in a row, {state} for {backoff:.0f}s")
+  return backoff
+
+
+async def get_unhealthy_sources():
+  """Get the sources that are failing, most failures first"""
+  db = await database.get_db()
+  return await db.fetch_all(
+    """SELECT s.id, s.url, h.consecutive_failures, h.last_success_at, h.last_failure_at, h.last_error,
+              h.next_eligible_at, h.disabled_at
+       FROM source_health h
+       JOIN sources s ON s.id = h.source_id
+       WHERE h.consecutive_failures > 0
+       ORDER BY h.consecutive_failures DESC, s.id"""
+  )
+
+
+async def print_source_health():
+  unhealthy_sources = await get_unhealthy_sources()
+  for source in unhealthy_sources:
+    state = f"disabled since {source.disabled_at}" if source.disabled_at else "backing off"
+    print(
+      f"{source.url}: {source.consecutive_failures} consecutive failures, {state}, "
+      f"last success {source.last_success_at}, next attempt {source.next_eligible_at}, "
+      f"last error: {source.last_error}"
+    )
+  print(f"{len(unhealthy_sources)} unhealthy sources")
+
+
+#
+#
+#
+async def run_daemon():
+  """
+  Keep ingesting sources, each on its own interval learned from how often it publishes
+
+  Connections and clients stay open between polls. Failing sources are backed off according to their health.
+  """
+  stop = asyncio.Event()
+  loop = asyncio.get_running_loop()
+  for signum in (signal.SIGINT, signal.SIGTERM):
+    loop.add_signal_handler(signum, stop.set)
+
+  sources = []
+  intervals = {}
+  next_poll_at = {}
+  schedule_refreshed_at = None
+
+  while not stop.is_set():
+    now = time.monotonic()
+    if schedule_refreshed_at is None or now - schedule_refreshed_at > constants.INGEST_SCHEDULE_REFRESH:
+      sources = await get_sources_with_health()
+      intervals = await get_source_poll_intervals()
+      schedule_refreshed_at = now
+      wall_now = datetime.datetime.now(datetime.timezone.utc)
+      # Deleted sources are dropped, so they don't keep the daemon waking up for polls that never happen
+      source_ids = {source.id for source in sources}
+      next_poll_at = {source_id: t for source_id, t in next_poll_at.items() if source_id in source_ids}
+      for source in sources:
+        # New sources are polled straight away, unless they are backing off from an earlier run
+        if source.id not in next_poll_at:
+          wait = (source.next_eligible_at - wall_now).total_seconds() if source.next_eligible_at else 0
+          next_poll_at[source.id] = now + max(wait, 0)
+      print(f"Scheduled {len(sources)} sources, {len(intervals)} with a learned poll interval")
+
+    ingested = False
     for source in sources:
+      if stop.is_set():
+        break
+      if next_poll_at[source.id] > time.monotonic():
+        continue
+      interval = intervals.get(source.id, constants.INGEST_DEFAULT_POLL_INTERVAL)
+      ingested = True
+      polled_at = datetime.datetime.now(datetime.timezone.utc)
       try:
-        job_id = await create_ingestion_job(source.id)
-        print(f"Starting ingestion job {job_id} for source {source.url}")
-        last_ingestion_date = await get_last_ingestion_date(source.id)
-        if last_ingestion_date:
-          print(f"Only processing items newer than {last_ingestion_date}")
-        processed = await feed_ingestion(source.id, source.url, job_id, last_ingestion_date)
-        total_processed += processed
-        await complete_ingestion_job(job_id, success=True)
+        await ingest_source(source)
+        await record_source_success(source.id, polled_at)
+        next_poll_at[source.id] = time.monotonic() + interval
       except Exception as e:
-        print(f"Error processing source {source.url}: {e}")
-        await complete_ingestion_job(job_id, success=False, error_message=str(e))
-    print(f"Completed ingestion pipeline. Processed {total_processed} items.")
+        backoff = await record_source_failure(source.id, str(e))
+        next_poll_at[source.id] = time.monotonic() + backoff
+
+    if ingested:
+      await fan_out_new_content()
+      await refresh_onboarding_pools(max_interval=constants.ONBOARDING_POOL_REBUILD_INTERVAL)
+
+    next_refresh_at = schedule_refreshed_at + constants.INGEST_SCHEDULE_REFRESH
+    sleep_seconds = min([next_refresh_at, *next_poll_at.values()]) - time.monotonic()
+    try:
+      await asyncio.wait_for(stop.wait(), timeout=max(sleep_seconds, 1))
+    except asyncio.TimeoutError:
+      pass
+
+  print("Stopping ingestion daemon")
+
+
+async def run_once():
+  sources = await get_sources_with_health(eligible_only=True)
+  total_processed = 0
+  for source in sources:
+    polled_at = datetime.datetime.now(datetime.timezone.utc)
+    try:
+      total_processed += await ingest_source(source)
+      await record_source_success(source.id, polled_at)
+    except Exception as e:
+      await record_source_failure(source.id, str(e))
+  await fan_out_new_content()
+  await refresh_onboarding_pools()
+  print(f"Completed ingestion pipeline. Processed {total_processed} items from {len(sources)} eligible sources.")
+
+
+async def main(daemon: bool = False, health: bool = False):
+  if health:
+    try:
+      await print_source_health()
+    finally:
+      await database.close_db()
+    return
+
+  try:
+    print("Starting ingestion daemon" if daemon else "Starting ingestion pipeline")
+    db = await database.get_db()
+    # Hold one connection for the whole run, as the advisory lock belongs to the session
+    async with db.connection():
+      if not await try_acquire_ingestion_lock():
+        print("Another ingestion run is in progress, exiting")
+        return
+      try:
+        if daemon:
+          await run_daemon()
+        else:
+          await run_once()
+      finally:
+        await release_ingestion_lock()
   except Exception as e:
     print(f"Error in ingestion pipeline: {e}")
   finally:
+    await clients.close_clients()
     await database.close_db()
 
 
 if __name__ == "__main__":
-  asyncio.run(main())
+  asyncio.run(main(daemon="--daemon" in sys.argv[1:], health="--health" in sys.argv[1:]))
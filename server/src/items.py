@@ -0,0 +1,182 @@
+import importlib.util
+import re
+import unicodedata
+import bs4
+import feedparser
+from typing import Literal, NamedTuple
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+from src import constants
+
+# lxml parses considerably faster than the pure Python parser, use it when it is installed
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+# Allow only safe HTML tags (e.g., <p>, <a>, <strong>)
+ALLOWED_TAGS = {"p", "a", "br", "ul", "li", "strong", "em"}
+ALLOWED_ATTRIBUTES = {"a": {"href", "title"}}
+ALLOWED_PROTOCOLS = {"", "http", "https", "mailto"}
+
+# Tags that are removed together with their content, rather than unwrapped
+DROPPED_TAGS = ["script", "style", "noscript", "iframe", "object", "embed", "template", "head", "title"]
+
+# Query parameters that only track where a link was shared, and never change the page it points to
+TRACKING_PARAMETERS = re.compile(
+  r"^(utm_.*|fbclid|gclid|dclid|msclkid|mc_cid|mc_eid|igshid|ref_src|cmpid|at_medium|at_campaign)$", re.IGNORECASE
+)
+
+WHITESPACE = re.compile(r"\s+")
+URL_IGNORED_CHARACTERS = re.compile(r"[\x00-\x20]")
+
+ContentType = Literal["audio", "video", "article", "unknown"]
+
+
+class EmbeddingInput(NamedTuple):
+  text: str
+  tokens: int  # approximated by whitespace separated words
+
+
+class ProcessedItem(NamedTuple):
+  html: str  # sanitized description
+  text: str  # plain text of the description with normalized whitespace
+  media: list[dict[str, str]]
+  content_type: ContentType
+
+
+def is_safe_url(url: str) -> bool:
+  # Browsers ignore control characters and whitespace in the scheme, e.g. "java\tscript:"
+  try:
+    scheme = urlparse(URL_IGNORED_CHARACTERS.sub("", url)).scheme.lower()
+  except ValueError:
+    # Malformed, e.g. an unclosed IPv6 host
+    return False
+  return scheme in ALLOWED_PROTOCOLS
+
+
+def canonicalize_url(url: str) -> str:
+  """
+  Normalize a link so the same page shared with different tracking parameters maps to one URL
+
+  Links that fail to parse are returned stripped but otherwise unchanged.
+  """
+  try:
+    parsed = urlparse(url.strip())
+  except ValueError:
+    return url.strip()
+  query = [
+    (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True) if not TRACKING_PARAMETERS.match(key)
+  ]
+  return urlunparse(
+    parsed._replace(
+      scheme=parsed.scheme.lower(),
+      netloc=parsed.netloc.lower(),
+      path=parsed.path or "/",
+      query=urlencode(query),
+      fragment="",
+    )
+  )
+
+
+def parse_description(description: str) -> tuple[str, str, list[dict[str, str]]]:
+  """
+  Parse the description HTML once, producing the sanitized HTML, its plain text and the embedded images
+  """
+  soup = bs4.BeautifulSoup(description, HTML_PARSER)
+
+  media = [
+    {"type": "image", "url": img.get("src"), "source": "html_embed"} for img in soup.find_all("img") if img.get("src")
+  ]
+
+  # Comments, doctypes, CDATA and processing instructions
+  for node in soup.find_all(string=lambda x: isinstance(x, bs4.element.PreformattedString)):
+    node.extract()
+  for tag in soup.find_all(DROPPED_TAGS):
+    tag.decompose()
+
+  for tag in soup.find_all(True):
+    if tag.name not in ALLOWED_TAGS:
+      tag.unwrap()
+      continue
+    allowed_attributes = ALLOWED_ATTRIBUTES.get(tag.name, set())
+    tag.attrs = {
+      name: value
+      for name, value in tag.attrs.items()
+      if name in allowed_attributes and (name != "href" or is_safe_url(value))
+    }
+
+  html = str(soup)
+  text = WHITESPACE.sub(" ", soup.get_text(" ")).strip()
+  return html, text, media
+
+
+def extract_feed_media(feed_item: feedparser.FeedParserDict) -> list[dict[str, str]]:
+  media = []
+
+  # 1. Check RSS enclosures (podcasts/images)
+  for enclosure in getattr(feed_item, "enclosures", []):
+    media.append(
+      {
+        "type": enclosure.type.split("/")[0],  # 'image', 'audio', etc.
+        "url": enclosure.href,
+        "source": "enclosure",
+      }
+    )
+
+  # 2. Check Media RSS
+  if hasattr(feed_item, "media_content"):
+    for mc in feed_item.media_content:
+      media.append({"type": mc.get("medium", mc.type.split("/")[0]), "url": mc["url"], "source": "media_rss"})
+
+  return media
+
+
+def detect_content_type(feed_item: feedparser.FeedParserDict, text: str) -> ContentType:
+  # Initialize type counters
+  type_counts = {"audio": 0, "video": 0, "article": 0}
+
+  # Priority 1: Check RSS/Media-RSS explicit tags
+  if hasattr(feed_item, "media_medium"):
+    if feed_item.media_medium == "audio":
+      type_counts["audio"] += 2
+    elif feed_item.media_medium == "video":
+      type_counts["video"] += 2
+
+  # Priority 2: Analyze enclosures
+  for enc in getattr(feed_item, "enclosures", []):
+    if enc.type.startswith("audio/"):
+      type_counts["audio"] += 1
+      break  # Only count once per type
+    elif enc.type.startswith("video/"):
+      type_counts["video"] += 1
+      break
+
+  # Priority 3: Heuristics (title/description text)
+  text = (feed_item.title + " " + text).lower()
+  if "podcast" in text or "episode" in text:
+    type_counts["audio"] += 1
+  elif "video" in text or "watch" in text:
+    type_counts["video"] += 1
+
+  # Determine final type based on majority
+  max_count = max(type_counts.values())
+  if max_count >= 2:
+    return max(type_counts, key=type_counts.get)
+
+  # Default to article if no clear majority
+  return "article" if not getattr(feed_item, "enclosures", []) else "unknown"
+
+
+def process_item(feed_item: feedparser.FeedParserDict) -> ProcessedItem:
+  """Sanitize a feed item's description and extract its plain text, media and content type in one pass"""
+  html, text, html_media = parse_description(feed_item.get("summary", ""))
+  return ProcessedItem(
+    html=html,
+    text=text,
+    media=extract_feed_media(feed_item) + html_media,
+    content_type=detect_content_type(feed_item, text),
+  )
+
+
+def get_embedding_input(title: str, text: str, max_tokens: int = constants.EMBED_MAX_TOKENS) -> EmbeddingInput:
+  """Build the text to embed from the title and plain text, normalized and truncated to max_tokens"""
+  words = unicodedata.normalize("NFKC", f"{title}: {text}" if text else title).split()
+  words = words[:max_tokens]
+  return EmbeddingInput(text=" ".join(words), tokens=len(words))
@@ -0,0 +1,160 @@
+import asyncio
+import random
+import time
+import numpy as np
+import sqlalchemy
+from datetime import datetime, timedelta
+from typing import NamedTuple
+from src import constants, database, vectors
+
+
+class Pool(NamedTuple):
+  content_ids: list[int]
+  embeddings: np.ndarray  # (len(content_ids), EMBED_DIM), normalized
+
+
+# Onboarding pools shared by all requests of a process
+_pools: list[Pool] = []
+_pools_loaded_at = 0.0
+
+
+#
+#
+#
+def build_pool(embeddings: np.ndarray, max_similarity: float, size: int, rng: np.random.Generator) -> list[int]:
+  """
+  Pick up to size mutually dissimilar rows of the normalized embeddings
+
+  Rows are visited in a random order and kept if their cosine similarity to every row kept so far is at most
+  max_similarity, so each pool built with a different rng is a different diverse sample.
+
+  Returns:
+      list: The indexes of the picked rows, in the order they were picked
+  """
+  order = rng.permutation(len(embeddings))
+  embeddings = embeddings[order]
+  # Highest similarity of each row to the rows picked so far
+  similarity = np.full(len(embeddings), -1.0, dtype=np.float32)
+  picked = []
+  while len(picked) < size:
+    allowed = np.flatnonzero(similarity <= max_similarity)
+    if not len(allowed):
+      break
+    picked.append(int(allowed[0]))
+    similarity = np.maximum(similarity, embeddings @ embeddings[allowed[0]])
+  return [int(order[x]) for x in picked]
+
+
+async def update_pools():
+  """Build ONBOARDING_POOL_COUNT pools from a sample of recent content and replace the stored pools"""
+  db = await database.get_db()
+  rows = await db.fetch_all(
+    sqlalchemy.select(database.content.c.id, database.content.c.embedding)
+    .where(
+      (database.content.c.date >= datetime.now() - timedelta(days=constants.MAX_CONTENT_AGE))
+      & database.content.c.embedding.is_not(None)
+      & database.content.c.canonical_id.is_(None)
+    )
+    .order_by(sqlalchemy.func.random())
+    .limit(constants.ONBOARDING_POOL_SAMPLE_SIZE)
+  )
+  if not rows:
+    print("No recent content to build onboarding pools from")
+    return 0
+
+  # Imported here, as the service imports this module. The threshold is read from the constants table, like the
+  # one the onboarding requests filter with
+  from src import service
+
+  max_similarity = await service.get_constant("MAX_ONBOARDING_COSINE_SIMILARITY")
+  embeddings = vectors.normalize(vectors.to_matrix([x.embedding for x in rows]))
+  rng = np.random.default_rng()
+  pools = [
+    build_pool(embeddings, max_similarity, constants.ONBOARDING_POOL_SIZE, rng)
+    for _ in range(constants.ONBOARDING_POOL_COUNT)
+  ]
+
+  async with db.transaction():
+    # Items are removed along with their pools
+    await db.execute(database.onboarding_pools.delete())
+    for pool in pools:
+      pool_id = await db.execute(database.onboarding_pools.insert(), {"size": len(pool)})
+      await db.execute(
+        """INSERT INTO onboarding_pool_items (pool_id, position, content_id)
+           SELECT :pool_id, position - 1, content_id
+           FROM UNNEST(cast(:content_ids as int[])) WITH ORDINALITY AS p(content_id, position)""",
+        {"pool_id": pool_id, "content_ids": [rows[x].id for x in pool]},
+      )
+
+  print(f"Built {len(pools)} onboarding pools of {min(map(len, pools))} to {max(map(len, pools))} items")
+  return len(pools)
+
+
+async def refresh_pools(max_interval: float = 0):
+  """Rebuild the pools, unless they were built in the last max_interval seconds"""
+  db = await database.get_db()
+  built_at = await db.fetch_val("SELECT MAX(created_at) FROM onboarding_pools")
+  if built_at and (datetime.now(built_at.tzinfo) - built_at).total_seconds() < max_interval:
+    return 0
+  return await update_pools()
+
+
+#
+#
+#
+async def load_pools():
+  """Load the pools and the embeddings of their content into the process cache"""
+  global _pools, _pools_loaded_at
+  db = await database.get_db()
+  items = database.onboarding_pool_items
+  rows = await db.fetch_all(
+    sqlalchemy.select(items.c.pool_id, items.c.content_id, database.content.c.embedding)
+    .select_from(items.join(database.content, items.c.content_id == database.content.c.id))
+    .order_by(items.c.pool_id, items.c.position)
+  )
+
+  rows_by_pool = {}
+  for x in rows:
+    rows_by_pool.setdefault(x.pool_id, []).append(x)
+  _pools = [
+    Pool([x.content_id for x in pool], vectors.normalize(vectors.to_matrix([x.embedding for x in pool])))
+    for pool in rows_by_pool.values()
+  ]
+  _pools_loaded_at = time.monotonic()
+
+
+async def sample_pool(existing_embeddings: list, existing_ids: list[int], max_similarity: float, count: int):
+  """
+  Sample up to count content ids from a random cached pool, skipping existing_ids and content more similar
+  than max_similarity to any existing_embeddings
+
+  Pools are cached for ONBOARDING_POOL_CACHE_TTL seconds. Returns an empty list when there are no pools yet.
+  """
+  if time.monotonic() - _pools_loaded_at > constants.ONBOARDING_POOL_CACHE_TTL:
+    await load_pools()
+  if not _pools:
+    return []
+
+  pool = random.choice(_pools)
+  keep = ~np.isin(pool.content_ids, existing_ids)
+  if len(existing_embeddings):
+    similarities = pool.embeddings @ vectors.normalize(vectors.to_matrix(existing_embeddings)).T
+    keep &= (similarities <= max_similarity).all(axis=1)
+
+  content_ids = [x for x, kept in zip(pool.content_ids, keep) if kept]
+  return random.sample(content_ids, min(count, len(content_ids)))
+
+
+async def main():
+  try:
+    print("Building onboarding pools")
+    await update_pools()
+  except Exception as e:
+    print(f"Error building onboarding pools: {e}")
+    raise
+  finally:
+    await database.close_db()
+
+
+if __name__ == "__main__":
+  asyncio.run(main())
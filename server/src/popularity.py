@@ -0,0 +1,151 @@
+import asyncio
+import time
+from src import constants, database
+
+
+# Popularity score of each rated content item, shared by all requests of a process
+_scores = {}
+_scores_loaded_at = 0.0
+
+
+#
+#
+#
+async def update_rating_stats(content_id: int, rating: float, previous=None):
+  """
+  Apply a rating to the aggregates of its content
+
+  Args:
+      content_id (int): ID of the rated content
+      rating (float): The new rating
+      previous: The user's previous rating row of this content, if they had rated it before
+  """
+  previous_rating = float(previous.rating) if previous else 0.0
+  # A rating that replaces one from within the recent window only changes the recent sum
+  previous_is_recent = (
+    previous is not None
+    and previous.timestamp is not None
+    and (time.time() - previous.timestamp.timestamp() < constants.POPULARITY_WINDOW * 3600)
+  )
+
+  db = await database.get_db()
+  await db.execute(
+    """INSERT INTO content_rating_stats AS s (
+         content_id, rating_count, rating_sum, positive_count, negative_count, recent_count, recent_sum, updated_at
+       )
+       VALUES (
+         :content_id, :count, :sum, :positive, :negative, :recent_count, :recent_sum, CURRENT_TIMESTAMP
+       )
+       ON CONFLICT (content_id) DO UPDATE
+       SET rating_count = s.rating_count + EXCLUDED.rating_count,
+           rating_sum = s.rating_sum + EXCLUDED.rating_sum,
+           positive_count = s.positive_count + EXCLUDED.positive_count,
+           negative_count = s.negative_count + EXCLUDED.negative_count,
+           recent_count = s.recent_count + EXCLUDED.recent_count,
+           recent_sum = s.recent_sum + EXCLUDED.recent_sum,
+           updated_at = CURRENT_TIMESTAMP""",
+    {
+      "content_id": content_id,
+      "count": 0 if previous else 1,
+      "sum": rating - previous_rating,
+      "positive": int(rating > 0) - int(previous_rating > 0),
+      "negative": int(rating < 0) - int(previous_rating < 0),
+      "recent_count": 0 if previous_is_recent else 1,
+      "recent_sum": rating - previous_rating if previous_is_recent else rating,
+    },
+  )
+
+
+async def refresh_recent_stats():
+  """
+  Recompute the recent window of the aggregates from the ratings of the last POPULARITY_WINDOW hours
+
+  Feedback writes only ever add ratings to the window, this drops the ones that have aged out of it.
+  """
+  db = await database.get_db()
+  values = {"window": constants.POPULARITY_WINDOW}
+  async with db.transaction():
+    expired = await db.fetch_val(
+      """WITH expired AS (
+           UPDATE content_rating_stats s
+           SET recent_count = 0, recent_sum = 0, updated_at = CURRENT_TIMESTAMP
+           WHERE s.recent_count > 0 AND NOT EXISTS (
+             SELECT 1
+             FROM user_content_ratings ucr
+             WHERE ucr.content_id = s.content_id
+               AND ucr.timestamp >= CURRENT_TIMESTAMP - make_interval(hours => :window)
+           )
+           RETURNING 1
+         )
+         SELECT COUNT(*) FROM expired""",
+      values,
+    )
+    updated = await db.fetch_val(
+      """WITH recent AS (
+           SELECT content_id, COUNT(*) AS count, SUM(rating) AS sum
+           FROM user_content_ratings
+           WHERE timestamp >= CURRENT_TIMESTAMP - make_interval(hours => :window)
+           GROUP BY content_id
+         ),
+         updated AS (
+           UPDATE content_rating_stats s
+           SET recent_count = r.count, recent_sum = r.sum, updated_at = CURRENT_TIMESTAMP
+           FROM recent r
+           WHERE s.content_id = r.content_id AND (s.recent_count != r.count OR s.recent_sum != r.sum)
+           RETURNING 1
+         )
+         SELECT COUNT(*) FROM updated""",
+      values,
+    )
+
+  print(f"Refreshed recent popularity: {updated} items updated, {expired} items aged out of the window")
+
+
+#
+#
+#
+async def load_scores():
+  """Load the popularity score of every rated content item into the process cache"""
+  global _scores, _scores_loaded_at
+  db = await database.get_db()
+  # Ratings from the recent window count twice, and the prior pulls rarely rated items towards 0
+  rows = await db.fetch_all(
+    """SELECT content_id, (rating_sum + recent_sum) / (rating_count + recent_count + :prior) AS score
+       FROM content_rating_stats
+       WHERE rating_count > 0""",
+    {"prior": constants.POPULARITY_PRIOR_COUNT},
+  )
+  _scores = {x.content_id: float(x.score) for x in rows}
+  _scores_loaded_at = time.monotonic()
+
+
+async def get_scores() -> dict[int, float]:
+  """Get the popularity score of each rated content item, between -1 and 1, cached for POPULARITY_CACHE_TTL seconds"""
+  if time.monotonic() - _scores_loaded_at > constants.POPULARITY_CACHE_TTL:
+    await load_scores()
+  return _scores
+
+
+async def apply_popularity(candidates: list):
+  """Set the popularity of each candidate, 0 for content that hasn't been rated"""
+  scores = await get_scores()
+  for candidate in candidates:
+    candidate.popularity = scores.get(candidate.id, 0.0)
+  return candidates
+
+
+#
+#
+#
+async def main():
+  try:
+    await refresh_recent_stats()
+  except Exception as e:
+    print(f"Error refreshing content popularity: {e}")
+    raise
+  finally:
+    await database.close_db()
+
+
+if __name__ == "__main__":
+  asyncio.run(main())
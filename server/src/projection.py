@@ -0,0 +1,168 @@
+import asyncio
+import sys
+import time
+import numpy as np
+import sqlalchemy
+from datetime import datetime, timedelta
+from typing import NamedTuple
+from src import constants, database, vectors
+
+
+class Projection(NamedTuple):
+  id: int
+  mean: np.ndarray  # (EMBED_DIM,)
+  components: np.ndarray  # (dim, EMBED_DIM), orthonormal rows
+
+  def project(self, embeddings: np.ndarray) -> np.ndarray:
+    """Project embeddings (a single vector or a matrix of row vectors) onto the principal components"""
+    return np.ascontiguousarray((np.asarray(embeddings, dtype=np.float32) - self.mean) @ self.components.T)
+
+
+#
+#
+#
+def fit_projection(embeddings: np.ndarray, dim: int) -> tuple[np.ndarray, np.ndarray, float]:
+  """
+  Fit a PCA projection to dim dimensions
+
+  Returns:
+      tuple: The mean, the principal components as rows and the fraction of the variance they explain
+  """
+  mean = embeddings.mean(axis=0)
+  _, singular_values, components = np.linalg.svd(embeddings - mean, full_matrices=False)
+  dim = min(dim, len(components))
+  variance = singular_values**2
+  explained = float(variance[:dim].sum() / variance.sum()) if variance.sum() > 0 else 1.0
+  return mean.astype(np.float32), components[:dim].astype(np.float32), explained
+
+
+def search_exact(embeddings: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+  """Indexes of the k rows nearest to the query by L2 distance, nearest first"""
+  squared_distances = np.einsum("ij,ij->i", embeddings, embeddings) - 2 * (embeddings @ query)
+  indexes = np.argpartition(squared_distances, k)[:k] if len(squared_distances) > k else np.arange(len(embeddings))
+  return indexes[np.argsort(squared_distances[indexes])]
+
+
+def search_two_stage(
+  embeddings: np.ndarray, reduced: np.ndarray, query: np.ndarray, reduced_query: np.ndarray, k: int, overfetch: int
+) -> np.ndarray:
+  """Shortlist k * overfetch rows by their distance in the reduced space, then rerank the shortlist exactly"""
+  shortlist = search_exact(reduced, reduced_query, k * overfetch)
+  return shortlist[search_exact(embeddings[shortlist], query, k)]
+
+
+def get_recall(embeddings: np.ndarray, projection: Projection, queries: np.ndarray, k: int, overfetch: int):
+  """
+  Compare two-stage search with exact search for each query
+
+  Returns:
+      tuple: The mean recall@k and the mean seconds per query of exact and two-stage search
+  """
+  reduced = projection.project(embeddings)
+  recalls, exact_seconds, two_stage_seconds = [], 0.0, 0.0
+  for query in queries:
+    start = time.perf_counter()
+    expected = search_exact(embeddings, query, k)
+    exact_seconds += time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = search_two_stage(embeddings, reduced, query, projection.project(query), k, overfetch)
+    two_stage_seconds += time.perf_counter() - start
+
+    recalls.append(len(np.intersect1d(expected, actual)) / len(expected))
+
+  return float(np.mean(recalls)), exact_seconds / len(queries), two_stage_seconds / len(queries)
+
+
+#
+#
+#
+async def get_recent_embeddings(limit: int) -> np.ndarray:
+  db = await database.get_db()
+  rows = await db.fetch_all(
+    sqlalchemy.select(database.content.c.embedding)
+    .where(
+      (database.content.c.date >= datetime.now() - timedelta(days=constants.MAX_CONTENT_AGE))
+      & database.content.c.embedding.is_not(None)
+      & database.content.c.canonical_id.is_(None)
+    )
+    .order_by(sqlalchemy.func.random())
+    .limit(limit)
+  )
+  return vectors.to_matrix([x.embedding for x in rows])
+
+
+async def get_latest_projection_id() -> int | None:
+  db = await database.get_db()
+  return await db.fetch_val("SELECT MAX(id) FROM embedding_projections")
+
+
+async def load_projection(projection_id: int) -> Projection:
+  db = await database.get_db()
+  row = await db.fetch_one(
+    database.embedding_projections.select().where(database.embedding_projections.c.id == projection_id)
+  )
+  components = np.frombuffer(row.components, dtype=np.float32).reshape(row.dim, constants.EMBED_DIM)
+  return Projection(id=row.id, mean=np.frombuffer(row.mean, dtype=np.float32), components=components)
+
+
+async def update_projection():
+  """Fit a projection on a sample of recent content, store it and report its recall"""
+  embeddings = await get_recent_embeddings(constants.PROJECTION_SAMPLE_SIZE)
+  if len(embeddings) <= constants.PROJECTION_DIM:
+    print(f"Not enough recent content to fit a {constants.PROJECTION_DIM} dimensional projection")
+    return None
+
+  mean, components, explained = fit_projection(embeddings, constants.PROJECTION_DIM)
+
+  db = await database.get_db()
+  projection_id = await db.execute(
+    database.embedding_projections.insert(),
+    {
+      "dim": len(components),
+      "mean": mean.tobytes(),
+      "components": components.tobytes(),
+      "explained_variance": explained,
+      "sample_size": len(embeddings),
+    },
+  )
+  # Only the latest projection is used, keep the previous one for workers that haven't picked this one up yet
+  await db.execute("DELETE FROM embedding_projections WHERE id < :id - 1", {"id": projection_id})
+  print(f"Fitted projection {projection_id} to {len(components)} dimensions on {len(embeddings)} items")
+  print(f"It explains {explained:.1%} of the variance")
+
+  await report_recall(Projection(projection_id, mean, components), embeddings)
+  return projection_id
+
+
+async def report_recall(projection: Projection, embeddings: np.ndarray):
+  k, overfetch = constants.PROJECTION_RECALL_K, constants.PROJECTION_OVERFETCH
+  queries = embeddings[np.random.default_rng(0).choice(len(embeddings), min(100, len(embeddings)), replace=False)]
+  recall, exact_seconds, two_stage_seconds = get_recall(embeddings, projection, queries, k, overfetch)
+  print(
+    f"recall@{k} with {overfetch}x over-fetch: {recall:.3f}, exact {exact_seconds * 1e3:.2f} ms, "
+    f"two-stage {two_stage_seconds * 1e3:.2f} ms per query over {len(embeddings)} items"
+  )
+
+
+async def main(report: bool = False):
+  try:
+    if report:
+      projection_id = await get_latest_projection_id()
+      if projection_id is None:
+        print("No projection has been fitted yet")
+        return
+      embeddings = await get_recent_embeddings(constants.PROJECTION_SAMPLE_SIZE)
+      await report_recall(await load_projection(projection_id), embeddings)
+    else:
+      print("Fitting embedding projection")
+      await update_projection()
+  except Exception as e:
+    print(f"Error fitting embedding projection: {e}")
+    raise
+  finally:
+    await database.close_db()
+
+
+if __name__ == "__main__":
+  asyncio.run(main(report="--report" in sys.argv[1:]))
@@ -1,70 +1,199 @@
 import asyncio
+from datetime import timedelta
 from src import constants
 from src import database
 
 
-async def prune_old_content():
-  print(f"Pruning content older than {constants.MAX_CONTENT_AGE} days...")
-
+#
+#
+#
+async def start_prune_run():
+  """Resume the last interrupted prune run, or start a new one"""
   db = await database.get_db()
-  try:
-    count_query = f"""
-        SELECT COUNT(*) as count
-        FROM content
-        WHERE date < CURRENT_DATE - INTERVAL '{constants.MAX_CONTENT_AGE} days'
-        """
-    result = await db.fetch_one(count_query)
-    count = result["count"] if result else 0
-
-    delete_query = f"""
-        DELETE FROM content
-        WHERE date < CURRENT_DATE - INTERVAL '{constants.MAX_CONTENT_AGE} days'
-        """
-    await db.execute(delete_query)
-
-    print(f"Pruned {count} content items older than {constants.MAX_CONTENT_AGE} days")
-    return count
-  except Exception as e:
-    print(f"Error pruning old content: {e}")
-    return 0
-
-
-async def prune_ingestion_logs():
-  print("Pruning ingestion logs older than 24 hours...")
 
+  # Batches are committed one at a time, so an interrupted run can carry on with its original cutoffs
+  run = await db.fetch_one(
+    """SELECT *
+       FROM prune_runs
+       WHERE status = 'running'
+       ORDER BY started_at DESC
+       LIMIT 1"""
+  )
+  if run:
+    print(f"Resuming interrupted prune run {run['id']} started at {run['started_at']}")
+    return run
+
+  return await db.fetch_one(
+    """INSERT INTO prune_runs (status, content_cutoff, logs_cutoff)
+       VALUES (
+         'running',
+         CURRENT_DATE - make_interval(days => :max_content_age),
+         CURRENT_TIMESTAMP - INTERVAL '24 hours'
+       )
+       RETURNING *""",
+    {"max_content_age": constants.MAX_CONTENT_AGE},
+  )
+
+
+async def complete_prune_run(run_id: int, success: bool = True, error_message: str = None):
+  """Mark a prune run as completed or failed and return its final statistics"""
   db = await database.get_db()
-  try:
-    count_query = """
-        SELECT COUNT(*) as count
-        FROM ingestion_jobs
-        WHERE start_time < CURRENT_TIMESTAMP - INTERVAL '24 hours'
-        """
-    result = await db.fetch_one(count_query)
+  status = "completed" if success else "failed"
+  return await db.fetch_one(
+    """UPDATE prune_runs
+       SET finished_at = CURRENT_TIMESTAMP, status = :status, error_message = :error_message
+       WHERE id = :run_id
+       RETURNING *""",
+    {"status": status, "error_message": error_message, "run_id": run_id},
+  )
+
+
+async def run_in_batches(query: str, values: dict) -> int:
+  """
+  Run a batched delete until it stops returning full batches, pausing between batches
+
+  The query must delete at most PRUNE_BATCH_SIZE rows, record its progress on the prune run and
+  return the number of rows it removed as `count`.
+  """
+  db = await database.get_db()
+  total = 0
+  while True:
+    result = await db.fetch_one(query, {**values, "batch_size": constants.PRUNE_BATCH_SIZE})
     count = result["count"] if result else 0
-
-    delete_query = """
-        DELETE FROM ingestion_jobs
-        WHERE start_time < CURRENT_TIMESTAMP - INTERVAL '24 hours'
-        """
-    await db.execute(delete_query)
-
-    print(f"Pruned {count} ingestion logs older than 24 hours")
-    return count
-  except Exception as e:
-    print(f"Error pruning ingestion logs: {e}")
-    return 0
-
-
+    total += count
+    if count < constants.PRUNE_BATCH_SIZE:
+      return total
+    await asyncio.sleep(constants.PRUNE_BATCH_PAUSE)
+
+
+#
+#
+#
+async def prune_old_content(run) -> int:
+  print(f"Pruning content older than {run['content_cutoff']}...")
+
+  # Ratings reference content, so they are moved to the archive in the same statement that deletes their content
+  count = await run_in_batches(
+    """WITH expired AS (
+         SELECT id
+         FROM content
+         WHERE date < :cutoff
+         ORDER BY id
+         LIMIT :batch_size
+         FOR UPDATE SKIP LOCKED
+       ),
+       moved_ratings AS (
+         DELETE FROM user_content_ratings ucr
+         USING expired e
+         WHERE ucr.content_id = e.id
+         RETURNING ucr.user_id, ucr.content_id, ucr.rating, ucr.timestamp
+       ),
+       archived_ratings AS (
+         INSERT INTO user_content_ratings_archive (user_id, content_id, rating, timestamp)
+         SELECT user_id, content_id, rating, timestamp FROM moved_ratings
+         RETURNING 1
+       ),
+       deleted AS (
+         DELETE FROM content c
+         USING expired e
+         WHERE c.id = e.id
+         RETURNING 1
+       )
+       UPDATE prune_runs
+       SET batches = batches + 1,
+           content_deleted = content_deleted + (SELECT COUNT(*) FROM deleted),
+           ratings_archived = ratings_archived + (SELECT COUNT(*) FROM archived_ratings)
+       WHERE id = :run_id
+       RETURNING (SELECT COUNT(*) FROM deleted) AS count""",
+    {"cutoff": run["content_cutoff"], "run_id": run["id"]},
+  )
+
+  print(f"Pruned {count} content items older than {run['content_cutoff']}")
+  return count
+
+
+async def prune_ingestion_logs(run) -> int:
+  print(f"Pruning ingestion logs older than {run['logs_cutoff']}...")
+
+  count = await run_in_batches(
+    """WITH deleted AS (
+         DELETE FROM ingestion_jobs
+         WHERE id IN (
+           SELECT id
+           FROM ingestion_jobs
+           WHERE start_time < :cutoff
+           ORDER BY id
+           LIMIT :batch_size
+           FOR UPDATE SKIP LOCKED
+         )
+         RETURNING 1
+       )
+       UPDATE prune_runs
+       SET batches = batches + 1, logs_deleted = logs_deleted + (SELECT COUNT(*) FROM deleted)
+       WHERE id = :run_id
+       RETURNING (SELECT COUNT(*) FROM deleted) AS count""",
+    {"cutoff": run["logs_cutoff"], "run_id": run["id"]},
+  )
+
+  print(f"Pruned {count} ingestion logs older than {run['logs_cutoff']}")
+  return count
+
+
+async def prune_embedding_cache(run) -> int:
+  print(f"Pruning embedding cache entries unused for {constants.EMBEDDING_CACHE_MAX_AGE} days...")
+
+  # Relative to the start of the run, so a resumed run keeps its cutoff
+  cutoff = run["started_at"] - timedelta(days=constants.EMBEDDING_CACHE_MAX_AGE)
+
+  count = await run_in_batches(
+    """WITH deleted AS (
+         DELETE FROM embedding_cache
+         WHERE key IN (
+           SELECT key
+           FROM embedding_cache
+           WHERE last_used_at < :cutoff
+           LIMIT :batch_size
+           FOR UPDATE SKIP LOCKED
+         )
+         RETURNING 1
+       )
+       UPDATE prune_runs
+       SET batches = batches + 1, cache_entries_deleted = cache_entries_deleted + (SELECT COUNT(*) FROM deleted)
+       WHERE id = :run_id
+       RETURNING (SELECT COUNT(*) FROM deleted) AS count""",
+    {"cutoff": cutoff, "run_id": run["id"]},
+  )
+
+  print(f"Pruned {count} embedding cache entries")
+  return count
+
+
+#
+#
+#
 async def main():
   try:
     print("Starting database pruning operations...")
 
-    content_count = await prune_old_content()
-    logs_count = await prune_ingestion_logs()
-
-    print(f"Pruning complete. Removed {content_count} content items and {logs_count} ingestion logs.")
+    run = await start_prune_run()
+    try:
+      await prune_old_content(run)
+      await prune_ingestion_logs(run)
+      await prune_embedding_cache(run)
+    except Exception as e:
+      await complete_prune_run(run["id"], success=False, error_message=str(e))
+      raise
+
+    stats = await complete_prune_run(run["id"], success=True)
+    print(
+      f"Pruning complete in {stats['finished_at'] - stats['started_at']} ({stats['batches']} batches). "
+      f"Removed {stats['content_deleted']} content items, archived {stats['ratings_archived']} ratings, "
+      f"removed {stats['logs_deleted']} ingestion logs "
+      f"and {stats['cache_entries_deleted']} embedding cache entries."
+    )
   except Exception as e:
     print(f"Error during pruning operations: {e}")
+    raise
   finally:
     await database.close_db()
 
@@ -0,0 +1,124 @@
+import abc
+import os
+import numpy as np
+from datetime import datetime
+from src import constants, vectors
+
+
+#
+#
+#
+class Ranker(abc.ABC):
+  """
+  Orders recommendation candidates for a feed
+
+  Candidates come sorted by their age-adjusted distance to the reference embedding, with their
+  embeddings and popularity attached. A seed makes the random part of a ranking reproducible.
+  """
+
+  name: str
+
+  @abc.abstractmethod
+  def rank(self, candidates: list, count: int, seed: int | None = None) -> list:
+    """Get the count candidates to show, in the order to show them"""
+
+
+class LegacyRanker(Ranker):
+  """The original ranking, which weighs each candidate's position by a random factor"""
+
+  name = "legacy"
+
+  def rank(self, candidates, count, seed=None):
+    rng = np.random.default_rng(seed)
+    for idx, candidate in enumerate(candidates):
+      candidate.rating = len(candidates) / (1 + (idx * rng.random()))
+
+    candidates.sort(key=lambda x: x.rating)
+
+    return candidates[:count]
+
+
+class MMRRanker(Ranker):
+  """
+  Maximal Marginal Relevance over a blend of relevance, recency and exploration noise
+
+  Each candidate's score is its relevance (age-adjusted distance, rescaled to [0, 1]) plus a recency
+  bonus, a popularity bonus and seeded noise. Candidates are then picked greedily by
+  mmr_lambda * score - (1 - mmr_lambda) * highest cosine similarity to the candidates picked so far,
+  so near-identical stories don't fill the feed.
+  """
+
+  name = "mmr"
+
+  def __init__(
+    self,
+    mmr_lambda: float = constants.RANK_MMR_LAMBDA,
+    recency_weight: float = constants.RANK_RECENCY_WEIGHT,
+    noise: float = constants.RANK_EXPLORATION_NOISE,
+    popularity_weight: float = constants.RANK_POPULARITY_WEIGHT,
+  ):
+    self.mmr_lambda = mmr_lambda
+    self.recency_weight = recency_weight
+    self.popularity_weight = popularity_weight
+    self.noise = noise
+
+  def get_scores(self, candidates: list, rng: np.random.Generator) -> np.ndarray:
+    distances = np.array([x.distance for x in candidates], dtype=np.float32)
+    spread = distances.max() - distances.min()
+    relevance = 1 - (distances - distances.min()) / spread if spread > 0 else np.ones_like(distances)
+
+    now = datetime.now().timestamp()
+    age_in_days = np.array([(now - x.date.timestamp()) / 86400 for x in candidates], dtype=np.float32)
+    recency = 1 - np.clip(age_in_days / constants.MAX_CONTENT_AGE, 0, 1)
+
+    popularity = np.array([x.popularity for x in candidates], dtype=np.float32)
+
+    return (
+      relevance
+      + self.recency_weight * recency
+      + self.popularity_weight * popularity
+      + self.noise * rng.standard_normal(len(candidates))
+    )
+
+  def rank(self, candidates, count, seed=None):
+    if not candidates:
+      return []
+
+    rng = np.random.default_rng(seed)
+    scores = self.get_scores(candidates, rng)
+    embeddings = vectors.normalize(vectors.to_matrix([x.embedding for x in candidates]))
+    similarities = embeddings @ embeddings.T
+
+    # Highest similarity of each candidate to the ones picked so far
+    redundancy = np.full(len(candidates), -1.0, dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    picked = []
+    for _ in range(min(count, len(candidates))):
+      mmr = self.mmr_lambda * scores - (1 - self.mmr_lambda) * np.maximum(redundancy, 0)
+      best = int(np.argmax(np.where(available, mmr, -np.inf)))
+      picked.append(best)
+      available[best] = False
+      redundancy = np.maximum(redundancy, similarities[best])
+
+    for rank, idx in enumerate(picked):
+      candidates[idx].rating = float(count - rank)
+    return [candidates[idx] for idx in picked]
+
+
+#
+#
+#
+RANKERS = {ranker.name: ranker for ranker in [LegacyRanker, MMRRanker]}
+
+_ranker: Ranker | None = None
+
+
+def get_ranker() -> Ranker:
+  """Get the ranker selected by RANKER (mmr or legacy), created on first use"""
+  global _ranker
+  if _ranker is None:
+    name = os.getenv("RANKER", "mmr")
+    if name not in RANKERS:
+      raise ValueError(f"Unknown ranker: {name}")
+    _ranker = RANKERS[name]()
+  return _ranker
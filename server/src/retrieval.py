@@ -0,0 +1,344 @@
+import abc
+import asyncio
+import os
+import time
+import numpy as np
+import sqlalchemy
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from src import constants, database, projection, util, vectors
+
+
+@dataclass
+class Candidate:
+  id: int
+  date: datetime
+  distance: float
+  embedding: np.ndarray | None = None
+  rating: float = 0.0
+  popularity: float = 0.0
+
+
+def get_age_cutoff(max_age: float) -> datetime:
+  """Start of the day max_age days ago, matching CURRENT_DATE - max_age days in Postgres"""
+  today = datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+  return today - timedelta(days=max_age)
+
+
+def top_k(values: np.ndarray, mask: np.ndarray, k: int) -> np.ndarray:
+  """Indexes of the k smallest values where mask is set, smallest first"""
+  indexes = np.flatnonzero(mask)
+  if len(indexes) > k:
+    indexes = indexes[np.argpartition(values[indexes], k)[:k]]
+  return indexes[np.argsort(values[indexes])]
+
+
+#
+#
+#
+class RetrievalEngine(abc.ABC):
+  """Finds the recent content nearest to an embedding, for recommendation candidates"""
+
+  name: str
+
+  async def refresh(self, max_interval: float = 0):
+    """Bring the engine up to date with the content table, unless it was refreshed in the last max_interval seconds"""
+
+  @abc.abstractmethod
+  async def search(
+    self,
+    user_id: str,
+    embedding,
+    max_distance: float,
+    max_age: float,
+    ignored_ids: list[int] | None,
+    limit: int,
+  ) -> list[Candidate]:
+    """
+    Get up to limit canonical content items from the last max_age days within max_distance (L2) of the
+    embedding, nearest first, skipping ignored_ids and content the user rated negatively
+    """
+
+  async def search_many(
+    self,
+    user_id: str,
+    embeddings: list,
+    max_distances: list[float],
+    max_age: float,
+    ignored_ids: list[int] | None,
+    limit: int,
+  ) -> list[list[Candidate]]:
+    """Search for several embeddings at once, returning the candidates of each in the same order"""
+    return [
+      await self.search(user_id, embedding, max_distance, max_age, ignored_ids, limit)
+      for embedding, max_distance in zip(embeddings, max_distances)
+    ]
+
+
+class PgvectorEngine(RetrievalEngine):
+  """Searches the content table in Postgres"""
+
+  name = "pgvector"
+
+  async def search(self, user_id, embedding, max_distance, max_age, ignored_ids, limit):
+    db = await database.get_db()
+    rows = await db.fetch_all(
+      """
+          SELECT c.id, c.date, c.embedding, c.embedding <-> :user_embedding AS distance
+          FROM content c
+          LEFT JOIN user_content_ratings ucr ON c.id = ucr.content_id AND ucr.user_id = :user_id
+          WHERE c.date >= CURRENT_DATE - make_interval(days => :max_age)
+          AND c.canonical_id IS NULL
+          AND c.id NOT IN (SELECT UNNEST(cast(:ignored_ids as int[])))
+          AND (ucr.rating IS NULL OR ucr.rating >= 0)
+          AND c.embedding <-> :user_embedding < :max_distance
+          ORDER BY c.embedding <-> :user_embedding
+          LIMIT :limit
+      """,
+      {
+        "user_id": user_id,
+        "user_embedding": util.list_to_string(embedding),
+        "max_age": int(max_age),
+        "ignored_ids": ignored_ids,
+        "max_distance": max_distance,
+        "limit": limit,
+      },
+    )
+    return [
+      Candidate(id=x.id, date=x.date, distance=x.distance, embedding=vectors.from_text(x.embedding)) for x in rows
+    ]
+
+  async def search_many(self, user_id, embeddings, max_distances, max_age, ignored_ids, limit):
+    db = await database.get_db()
+    # Each reference embedding runs its own nearest neighbour scan, all in one statement
+    rows = await db.fetch_all(
+      """
+          WITH queries AS (
+            SELECT cast(q.embedding as vector) AS embedding, q.max_distance, q.query_index
+            FROM UNNEST(cast(:embeddings as text[]), cast(:max_distances as float8[]))
+              WITH ORDINALITY AS q(embedding, max_distance, query_index)
+          ),
+          negative_ratings AS (
+            SELECT content_id FROM user_content_ratings WHERE user_id = :user_id AND rating < 0
+          )
+          SELECT q.query_index, n.id, n.date, n.embedding, n.distance
+          FROM queries q
+          CROSS JOIN LATERAL (
+            SELECT c.id, c.date, c.embedding, c.embedding <-> q.embedding AS distance
+            FROM content c
+            WHERE c.date >= CURRENT_DATE - make_interval(days => :max_age)
+            AND c.canonical_id IS NULL
+            AND c.id NOT IN (SELECT UNNEST(cast(:ignored_ids as int[])))
+            AND c.id NOT IN (SELECT content_id FROM negative_ratings)
+            AND c.embedding <-> q.embedding < q.max_distance
+            ORDER BY c.embedding <-> q.embedding
+            LIMIT :limit
+          ) n
+          ORDER BY q.query_index, n.distance
+      """,
+      {
+        "user_id": user_id,
+        "embeddings": [util.list_to_string(x) for x in embeddings],
+        "max_distances": [float(x) for x in max_distances],
+        "max_age": int(max_age),
+        "ignored_ids": ignored_ids,
+        "limit": limit,
+      },
+    )
+
+    # query_index comes from WITH ORDINALITY and starts at 1
+    results = [[] for _ in embeddings]
+    for x in rows:
+      results[x.query_index - 1].append(
+        Candidate(id=x.id, date=x.date, distance=x.distance, embedding=vectors.from_text(x.embedding))
+      )
+    return results
+
+
+class InMemoryEngine(RetrievalEngine):
+  """
+  Keeps the ids, dates and embeddings of recent canonical content in contiguous arrays and answers
+  searches with one matrix-vector product
+
+  New content is picked up by polling for ids above the highest loaded id, at most every
+  RETRIEVAL_REFRESH_INTERVAL seconds, and content older than the window is dropped on the way.
+
+  With two_stage, the embeddings are also kept projected onto the latest PCA projection fitted by
+  src.projection. Searches scan the reduced matrix for PROJECTION_OVERFETCH times the candidates
+  they need, and only compute exact distances for that shortlist.
+  """
+
+  name = "memory"
+
+  def __init__(self, window: float = constants.MAX_CONTENT_AGE, two_stage: bool = False):
+    self.window = window
+    self.two_stage = two_stage
+    self.projection: projection.Projection | None = None
+    self.lock = asyncio.Lock()
+    self.clear()
+
+  def clear(self):
+    self.ids = np.empty(0, dtype=np.int64)
+    self.dates = np.empty(0, dtype=np.float64)  # Unix timestamps
+    self.embeddings = np.empty((0, constants.EMBED_DIM), dtype=np.float32)
+    self.squared_norms = np.empty(0, dtype=np.float32)
+    self.reduced = None
+    self.reduced_squared_norms = None
+    self.max_id = 0
+    self.refreshed_at = 0.0
+
+  def __len__(self):
+    return len(self.ids)
+
+  def load_snapshot(self, path: str):
+    """Load the content of a snapshot instead of reading it from the database, newer content is polled for after"""
+    from src import snapshot
+
+    ids, dates, canonical, embeddings = snapshot.load_vectors(path)
+    keep = canonical & (dates >= get_age_cutoff(self.window).timestamp())
+    self.ids = ids[keep]
+    self.dates = dates[keep]
+    self.embeddings = np.ascontiguousarray(embeddings[keep], dtype=np.float32)
+    self.squared_norms = np.einsum("ij,ij->i", self.embeddings, self.embeddings)
+    self.reduced = None
+    self.max_id = int(ids.max()) if len(ids) else 0
+    print(f"Loaded {len(self.ids)} items from the snapshot in {path}")
+
+  async def refresh(self, max_interval: float = 0):
+    async with self.lock:
+      # Concurrent searches wait for the refresh that is already running rather than starting another one
+      if time.monotonic() - self.refreshed_at < max_interval:
+        return
+
+      cutoff = get_age_cutoff(self.window)
+      db = await database.get_db()
+      rows = await db.fetch_all(
+        sqlalchemy.select(database.content.c.id, database.content.c.date, database.content.c.embedding)
+        .where(
+          (database.content.c.id > self.max_id)
+          & (database.content.c.date >= cutoff)
+          & database.content.c.embedding.is_not(None)
+          & database.content.c.canonical_id.is_(None)
+        )
+        .order_by(database.content.c.id)
+      )
+      latest_projection = await self.get_latest_projection() if self.two_stage else None
+
+      # Nothing is awaited from here on, so searches never see the arrays partially updated
+      keep = self.dates >= cutoff.timestamp()
+      new_embeddings = vectors.to_matrix([x.embedding for x in rows])
+      self.ids = np.concatenate([self.ids[keep], np.array([x.id for x in rows], dtype=np.int64)])
+      self.dates = np.concatenate([self.dates[keep], np.array([x.date.timestamp() for x in rows], dtype=np.float64)])
+      self.embeddings = np.ascontiguousarray(np.concatenate([self.embeddings[keep], new_embeddings]))
+      self.squared_norms = np.concatenate(
+        [self.squared_norms[keep], np.einsum("ij,ij->i", new_embeddings, new_embeddings)]
+      )
+      if rows:
+        self.max_id = rows[-1].id
+
+      if latest_projection is not None:
+        # Project the new embeddings, or all of them when a new projection was fitted
+        if latest_projection is not self.projection or self.reduced is None:
+          self.projection = latest_projection
+          self.reduced = latest_projection.project(self.embeddings)
+        else:
+          self.reduced = np.concatenate([self.reduced[keep], latest_projection.project(new_embeddings)])
+        self.reduced_squared_norms = np.einsum("ij,ij->i", self.reduced, self.reduced)
+      self.refreshed_at = time.monotonic()
+
+  async def get_latest_projection(self) -> projection.Projection | None:
+    """Get the latest fitted projection, only loading it when it changed"""
+    projection_id = await projection.get_latest_projection_id()
+    if projection_id is None:
+      return None
+    if self.projection is not None and self.projection.id == projection_id:
+      return self.projection
+    return await projection.load_projection(projection_id)
+
+  async def get_negatively_rated_ids(self, user_id: str) -> np.ndarray:
+    db = await database.get_db()
+    rows = await db.fetch_all(
+      "SELECT content_id FROM user_content_ratings WHERE user_id = :user_id AND rating < 0", {"user_id": user_id}
+    )
+    return np.array([x.content_id for x in rows], dtype=np.int64)
+
+  async def search(self, user_id, embedding, max_distance, max_age, ignored_ids, limit):
+    return (await self.search_many(user_id, [embedding], [max_distance], max_age, ignored_ids, limit))[0]
+
+  async def search_many(self, user_id, embeddings, max_distances, max_age, ignored_ids, limit):
+    if max_age > self.window:
+      # MAX_CONTENT_AGE was raised, older content has to be loaded as well
+      self.window = max_age
+      self.clear()
+    await self.refresh(max_interval=constants.RETRIEVAL_REFRESH_INTERVAL)
+
+    queries = vectors.to_matrix(embeddings)
+    excluded = np.concatenate(
+      [np.asarray(ignored_ids or [], dtype=np.int64), await self.get_negatively_rated_ids(user_id)]
+    )
+    mask = (self.dates >= get_age_cutoff(max_age).timestamp()) & ~np.isin(self.ids, excluded)
+
+    # One matrix-matrix product for all queries, |x - q|^2 = |x|^2 + |q|^2 - 2 x.q
+    if self.reduced is not None:
+      # Distances in the projected space are never larger than the exact distances, so the
+      # max_distance filter can be applied to them without dropping any candidate
+      reduced_queries = self.projection.project(queries)
+      reduced_squared_distances = (
+        self.reduced_squared_norms[None, :]
+        + np.einsum("ij,ij->i", reduced_queries, reduced_queries)[:, None]
+        - 2 * (reduced_queries @ self.reduced.T)
+      )
+    else:
+      all_squared_distances = (
+        self.squared_norms[None, :]
+        + np.einsum("ij,ij->i", queries, queries)[:, None]
+        - 2 * (queries @ self.embeddings.T)
+      )
+
+    results = []
+    for i, (query, max_distance) in enumerate(zip(queries, max_distances)):
+      if self.reduced is not None:
+        row = reduced_squared_distances[i]
+        indexes = top_k(row, (row < max_distance**2) & mask, limit * constants.PROJECTION_OVERFETCH)
+        # Exact distances for the shortlist only
+        squared_distances = self.squared_norms[indexes] + query @ query - 2 * (self.embeddings[indexes] @ query)
+      else:
+        indexes = np.arange(len(self.ids))
+        squared_distances = all_squared_distances[i]
+
+      nearest = top_k(squared_distances, (squared_distances < max_distance**2) & mask[indexes], limit)
+      distances = np.sqrt(np.maximum(squared_distances[nearest], 0))
+      results.append(
+        [
+          Candidate(
+            id=int(self.ids[j]),
+            date=datetime.fromtimestamp(self.dates[j], timezone.utc),
+            distance=float(d),
+            embedding=self.embeddings[j],
+          )
+          for j, d in zip(indexes[nearest], distances)
+        ]
+      )
+    return results
+
+
+#
+#
+#
+_engine: RetrievalEngine | None = None
+
+
+def create_engine(name: str) -> RetrievalEngine:
+  if name == "pgvector":
+    return PgvectorEngine()
+  if name == "memory":
+    return InMemoryEngine(two_stage=os.getenv("RETRIEVAL_TWO_STAGE", "") == "1")
+  raise ValueError(f"Unknown retrieval engine: {name}")
+
+
+def get_engine() -> RetrievalEngine:
+  """Get the retrieval engine selected by RETRIEVAL_ENGINE (pgvector or memory), created on first use"""
+  global _engine
+  if _engine is None:
+    _engine = create_engine(os.getenv("RETRIEVAL_ENGINE", "pgvector"))
+  return _engine
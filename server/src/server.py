@@ -3,7 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from typing import Dict, Any
 from fastapi.responses import HTMLResponse
-from src import service, visualize, validators, auth, database
+from src import service, validators, auth, clients, database, workers
 import sys
 import json
 from contextlib import asynccontextmanager
@@ -25,9 +25,12 @@ if is_prod:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
   # Startup: setup resources
+  auth.get_clerk()
   await startup_db_client()
+  await service.load_warm_state()
   yield
   # Shutdown: clean up resources
+  await clients.close_clients()
   await shutdown_db_client()
 
 
@@ -72,7 +75,30 @@ async def get_feed(request: Request, flavour_id: int | None = None, recommendati
   content = await service.get_recommendations(
     user.id, flavour_id, [int(x) for x in recommendation_ids.split(",")] if recommendation_ids else None
   )
+  return {"content": validate_user_content(content)}
 
+
+@app.get("/feed/batch")
+async def get_feed_batch(request: Request, flavour_ids: str = "", recommendation_ids: str = "") -> Dict[str, list]:
+  """
+  Get the main feed and the feeds of several flavours in one request
+  """
+  user = await auth.authenticate(request)
+  if user.embedding is None:
+    raise HTTPException(status_code=409, detail="User has not completed onboarding")
+  feeds = await service.get_batch_recommendations(
+    user.id,
+    [int(x) for x in flavour_ids.split(",")] if flavour_ids else [],
+    [int(x) for x in recommendation_ids.split(",")] if recommendation_ids else None,
+  )
+  if feeds is None:
+    raise HTTPException(status_code=404, detail="Flavour not found")
+  return {
+    "feeds": [{"flavour_id": flavour_id, "content": validate_user_content(content)} for flavour_id, content in feeds]
+  }
+
+
+def validate_user_content(content: list) -> list[validators.UserContentItem]:
   # Parse content items and ensure media is properly formatted
   validated_content = []
   for content_item in content:
@@ -98,28 +124,14 @@ async def get_feed(request: Request, flavour_id: int | None = None, recommendati
       print(f"Error validating content item: {e}")
       continue
 
-  return {"content": validated_content}
+  return validated_content
 
 
 @app.get("/closest")
 async def get_closest_content(request: Request) -> Dict[str, list]:
   user = await auth.authenticate(request)
   content = await service.get_closest_content(user.id)
-
-  # Parse content items and ensure media is properly formatted
-  validated_content = []
-  for content_item in content:
-    content_item_dict = dict(content_item)
-
-    if "media" in content_item_dict:
-      try:
-        content_item_dict["media"] = json.loads(content_item_dict["media"])
-      except json.JSONDecodeError:
-        content_item_dict["media"] = []
-
-    validated_content.append(validators.UserContentItem(**content_item_dict))
-
-  return {"content": validated_content}
+  return {"content": validate_user_content(content)}
 
 
 @app.get("/health")
@@ -133,10 +145,11 @@ async def health_check() -> Dict[str, str]:
 @app.get("/visualization", response_class=HTMLResponse)
 async def get_visualization(request: Request) -> str:
   user = await auth.authenticate(request)
+
   # Get user embedding history if available
   user_embeddings = [user.embedding]
   # Get HTML for visualization
-  html_content = await visualize.get_visualization_html(user_embeddings)
+  html_content = await service.get_visualization_html(user.id, user_embeddings)
   return html_content
 
 
@@ -206,9 +219,20 @@ def start_server(host: str = "0.0.0.0", port: int = 8000, debug: bool = False):
   uvicorn.run("src.server:app", host=host, port=port, reload=debug)
 
 
+def start_prod_server(host: str = "0.0.0.0", port: int = 8000):
+  """
+  Start the FastAPI server with forked uvicorn workers, the number of which is set by WEB_CONCURRENCY.
+
+  Args:
+      host: Host address to bind the server to
+      port: Port to run the server on
+  """
+  workers.serve("src.server:app", host=host, port=port, workers=workers.get_worker_count())
+
+
 if __name__ == "__main__":
   # Start the server when this file is run directly
   if is_prod:
-    start_server(debug=False)
+    start_prod_server()
   else:
     start_server(debug=True)
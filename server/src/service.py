@@ -1,25 +1,31 @@
+import asyncio
 import os
-import torch
+import time
 import uuid
 import numpy as np
 from datetime import datetime
-from src import database, util
+from src import clients, constants, database, fanout, onboarding, popularity, ranking, retrieval, singleflight
+from src import util, vectors
 import sqlalchemy
 
-from openai import OpenAI
 
-client = OpenAI(base_url=os.getenv("LLM_BASE_URL"), api_key=os.getenv("LLM_API_KEY"))
+# Warm state shared by all requests of a process, loaded before the server forks its workers when possible
+_constants = {}
+_constants_loaded_at = 0.0
+_source_urls = {}
+_source_urls_loaded_at = 0.0
+# Content rows without their embeddings, for hydrating feeds
+_content_rows = util.LRUCache(constants.CONTENT_CACHE_SIZE)
 
+# Concurrent identical feed and visualization requests share one computation, and the next page of a feed is
+# computed in the background once a page has been served, so that the request for it finds it ready
+_feed_flights = singleflight.SingleFlight()
+_prefetched_feeds = singleflight.TaskCache(constants.FEED_PREFETCH_TTL, constants.FEED_PREFETCH_MAX_ENTRIES)
+_visualization_flights = singleflight.SingleFlight()
 
-async def get_constant(name):
-  """Get a constant value from the database"""
-  db = await database.get_db()
-  constant = await db.fetch_one(database.constants_table.select().where(database.constants_table.c.name == name))
-  if not constant:
-    raise Exception(f"Constant {name} not found in database")
 
+def parse_constant(value: str):
   # Convert string value to appropriate type
-  value = constant.value
   try:
     # Try to convert to float first
     return float(value)
@@ -28,6 +34,62 @@ async def get_constant(name):
     return value
 
 
+async def load_constants():
+  """Load all constants from the database into the process cache"""
+  global _constants, _constants_loaded_at
+  db = await database.get_db()
+  rows = await db.fetch_all(database.constants_table.select())
+  _constants = {x.name: parse_constant(x.value) for x in rows}
+  _constants_loaded_at = time.monotonic()
+
+
+async def get_constant(name):
+  """Get a constant value from the database, cached for CONSTANTS_CACHE_TTL seconds"""
+  if name not in _constants or time.monotonic() - _constants_loaded_at > constants.CONSTANTS_CACHE_TTL:
+    await load_constants()
+  if name not in _constants:
+    raise Exception(f"Constant {name} not found in database")
+  return _constants[name]
+
+
+async def load_sources():
+  """Load the source id to url map into the process cache"""
+  global _source_urls, _source_urls_loaded_at
+  db = await database.get_db()
+  rows = await db.fetch_all(database.sources.select())
+  _source_urls = {x.id: x.url for x in rows}
+  _source_urls_loaded_at = time.monotonic()
+
+
+async def get_source_urls(source_ids=()) -> dict[int, str]:
+  """
+  Get the source id to url map, cached for SOURCES_CACHE_TTL seconds
+
+  The map is reloaded straight away when it doesn't have one of source_ids yet (a source was added).
+  """
+  if (
+    not _source_urls
+    or time.monotonic() - _source_urls_loaded_at > constants.SOURCES_CACHE_TTL
+    or any(x not in _source_urls for x in source_ids)
+  ):
+    await load_sources()
+  return _source_urls
+
+
+async def load_warm_state():
+  """Load the state that every request needs, unless it was already loaded before the process forked"""
+  if not _constants:
+    await load_constants()
+  if not _source_urls:
+    await load_sources()
+  # The in-memory retrieval engine loads recent content here, the pgvector engine has nothing to load
+  engine = retrieval.get_engine()
+  snapshot_path = os.getenv("VECTOR_SNAPSHOT_PATH")
+  if snapshot_path and isinstance(engine, retrieval.InMemoryEngine) and not len(engine):
+    engine.load_snapshot(snapshot_path)
+  await engine.refresh(max_interval=constants.RETRIEVAL_REFRESH_INTERVAL)
+
+
 #
 #
 #
@@ -38,37 +100,45 @@ async def get_recommendation_candidates(
   Get a list of recommendation candidates for a user
   """
 
-  db = await database.get_db()
   max_content_age = await get_constant("MAX_CONTENT_AGE")
   max_distance = util.cosine_to_l2_distance(min_similarity)
 
   # Find all content ids near the user embedding
-  candidates = await db.fetch_all(
-    f"""
-        SELECT c.id, c.date, c.embedding <-> :user_embedding AS distance
-        FROM content c
-        LEFT JOIN user_content_ratings ucr ON c.id = ucr.content_id AND ucr.user_id = :user_id
-        WHERE c.date >= CURRENT_DATE - INTERVAL '{max_content_age} days'
-        AND c.id NOT IN (SELECT UNNEST(cast(:ignored_ids as int[])))
-        AND (ucr.rating IS NULL OR ucr.rating >= 0)
-        AND c.embedding <-> :user_embedding < :max_distance
-        ORDER BY c.embedding <-> :user_embedding
-        LIMIT :limit
-    """,
-    {
-      "user_id": user_id,
-      "user_embedding": util.list_to_string(user_embedding),
-      "ignored_ids": recommendation_ids,
-      "max_distance": max_distance,
-      "limit": 100,
-    },
+  candidates = await retrieval.get_engine().search(
+    user_id, user_embedding, max_distance, max_content_age, recommendation_ids, limit=100
   )
+  await popularity.apply_popularity(candidates)
 
-  if not candidates:
-    return []
+  return apply_age_penalty(candidates, await get_constant("AGE_PENALTY_FACTOR"))
+
+
+async def get_batch_recommendation_candidates(
+  user_id: int, embeddings: list, min_similarities: list[float], recommendation_ids: list[int] | None = None
+):
+  """
+  Get the recommendation candidates for several reference embeddings of a user with one batched search
+  """
+
+  max_content_age = await get_constant("MAX_CONTENT_AGE")
+  max_distances = [util.cosine_to_l2_distance(x) for x in min_similarities]
+
+  candidate_lists = await retrieval.get_engine().search_many(
+    user_id, embeddings, max_distances, max_content_age, recommendation_ids, limit=100
+  )
+
+  for candidates in candidate_lists:
+    await popularity.apply_popularity(candidates)
 
-  current_date = datetime.now().timestamp()
   age_penalty_factor = await get_constant("AGE_PENALTY_FACTOR")
+  return [apply_age_penalty(candidates, age_penalty_factor) for candidates in candidate_lists]
+
+
+def apply_age_penalty(candidates: list, age_penalty_factor: float):
+  """
+  Add a penalty for the age of each candidate to its distance and sort the candidates by distance
+  """
+
+  current_date = datetime.now().timestamp()
 
   # Adjust the distance by applying the age penalty
   for candidate in candidates:
@@ -82,22 +152,57 @@ async def get_recommendation_candidates(
   return candidates
 
 
-def rank_candidates(candidates: list):
+def get_feed_key(user_id: int, flavour_id: int | None, recommendation_ids: list[int] | None):
+  return (user_id, flavour_id or None, frozenset(recommendation_ids or []))
+
+
+def invalidate_user(user_id: int):
+  """Drop the feed pages and visualizations computed for a user, after their ratings or embedding changed"""
+  _prefetched_feeds.discard(lambda key: key[0] == user_id)
+  _feed_flights.forget(lambda key: key[0] == user_id)
+  _visualization_flights.forget(lambda key: key == user_id)
+
+
+async def get_recommendations(user_id: int, flavour_id: int | None = None, recommendation_ids: list[int] | None = None):
   """
-  Rank the candidates based on their distance and a random factor
+  Get recommendations for user, from a page computed ahead of the request when there is one
   """
 
-  for idx, candidate in enumerate(candidates):
-    candidate.rating = len(candidates) / (1 + (idx * np.random.random()))
-
-  candidates.sort(key=lambda x: x.rating)
+  key = get_feed_key(user_id, flavour_id, recommendation_ids)
+  prefetched = _prefetched_feeds.get(key)
+  task = prefetched or _feed_flights.start(
+    key, lambda: compute_recommendations(user_id, flavour_id, recommendation_ids)
+  )
+  content = await asyncio.shield(task)
+  if prefetched:
+    # Pages computed ahead of their request leave their fresh picks in the inbox until they are served
+    await fanout.remove_fresh_picks(user_id, flavour_id, [x["id"] for x in content])
+
+  # Clients ask for the next page with the ids of every page so far
+  if content:
+    next_ids = [*(recommendation_ids or []), *(x["id"] for x in content)]
+    next_key = get_feed_key(user_id, flavour_id, next_ids)
+    if next_key not in _prefetched_feeds:
+      # A flight of its own, so requests only get the prefetched page through _prefetched_feeds
+      task = _feed_flights.start(
+        (*next_key, "prefetch"),
+        lambda: compute_recommendations(user_id, flavour_id, next_ids, take_fresh_picks=False),
+      )
+      _prefetched_feeds.put(next_key, task)
 
-  return candidates
+  return content
 
 
-async def get_recommendations(user_id: int, flavour_id: int | None = None, recommendation_ids: list[int] | None = None):
+async def compute_recommendations(
+  user_id: int,
+  flavour_id: int | None = None,
+  recommendation_ids: list[int] | None = None,
+  take_fresh_picks: bool = True,
+):
   """
-  Get recommendations for user
+  Compute recommendations for user, skipping recommendation_ids
+
+  With take_fresh_picks False, the fresh picks in the page are only read and stay in the user's inbox.
   """
 
   db = await database.get_db()
@@ -115,56 +220,128 @@ async def get_recommendations(user_id: int, flavour_id: int | None = None, recom
     min_similarity = min_search_cosine_similarity
 
   candidates = await get_recommendation_candidates(user_id, reference_embedding, min_similarity, recommendation_ids)
-  ranked_candidates = rank_candidates(candidates)
-  recommendation_ids = [candidate.id for candidate in ranked_candidates][: int(num_recommendations)]
+  fresh_picks = await fanout.take_fresh_picks(
+    user_id, [flavour_id or None], recommendation_ids, constants.FRESH_PICKS_PER_FEED, remove=take_fresh_picks
+  )
+  recommendation_ids = rank_feed(fresh_picks[flavour_id or None], candidates, int(num_recommendations))
 
-  # Join content with user_content_ratings to get user ratings
-  content = await db.fetch_all(
-    """
-    SELECT
-      c.id, c.content_type, c.title, c.url, c.description, c.source_id, c.date, c.media,
-      s.url as source_url,
-      COALESCE(ucr.rating, 0) as rating
-    FROM content c
-    LEFT JOIN user_content_ratings ucr ON c.id = ucr.content_id AND ucr.user_id = :user_id
-    LEFT JOIN sources s ON c.source_id = s.id
-    WHERE c.id IN (SELECT UNNEST(cast(:content_ids as int[])))
-    """,
-    {"user_id": user_id, "content_ids": recommendation_ids},
+  return await get_user_content(user_id, recommendation_ids)
+
+
+async def get_batch_recommendations(
+  user_id: int, flavour_ids: list[int], recommendation_ids: list[int] | None = None
+) -> list[tuple[int | None, list]] | None:
+  """
+  Get the recommendations of the main feed and several flavours of a user at once
+
+  Returns:
+      list: (flavour_id, content) for the main feed (flavour_id None) followed by each flavour, or None if a
+      flavour doesn't exist or belongs to another user
+  """
+
+  db = await database.get_db()
+  user = await db.fetch_one(database.users.select().where(database.users.c.id == user_id))
+  min_flavour_cosine_similarity = await get_constant("MIN_FLAVOUR_COSINE_SIMILARITY")
+  min_search_cosine_similarity = await get_constant("MIN_SEARCH_COSINE_SIMILARITY")
+  num_recommendations = await get_constant("NUM_RECOMMENDATIONS")
+
+  # Flavours of other users are treated as missing
+  flavours = await db.fetch_all(
+    database.user_flavours.select().where(
+      database.user_flavours.c.id.in_(flavour_ids) & (database.user_flavours.c.user_id == user_id)
+    )
   )
+  flavours_by_id = {x.id: x for x in flavours}
+  if set(flavour_ids) - flavours_by_id.keys():
+    return None
 
-  return content
+  feed_flavour_ids = [None, *flavour_ids]
+  embeddings = [user.embedding, *(flavours_by_id[x].embedding for x in flavour_ids)]
+  min_similarities = [min_search_cosine_similarity, *(min_flavour_cosine_similarity for _ in flavour_ids)]
+
+  candidate_lists = await get_batch_recommendation_candidates(user_id, embeddings, min_similarities, recommendation_ids)
+  fresh_picks = await fanout.take_fresh_picks(
+    user_id, feed_flavour_ids, recommendation_ids, constants.FRESH_PICKS_PER_FEED
+  )
+  feed_ids = [
+    rank_feed(fresh_picks[flavour_id], candidates, int(num_recommendations))
+    for flavour_id, candidates in zip(feed_flavour_ids, candidate_lists)
+  ]
+
+  # Feeds often share items, each item is only loaded once
+  content = await get_user_content(user_id, list({x for ids in feed_ids for x in ids}))
+  content_by_id = {x["id"]: x for x in content}
+
+  return [
+    (flavour_id, [content_by_id[x] for x in ids if x in content_by_id])
+    for flavour_id, ids in zip(feed_flavour_ids, feed_ids)
+  ]
+
+
+def rank_feed(fresh_ids: list[int], candidates: list, count: int) -> list[int]:
+  """
+  Get the content ids of a feed, the fresh picks from the user's inbox followed by the ranked candidates
+  """
+
+  fresh = set(fresh_ids)
+  candidates = [candidate for candidate in candidates if candidate.id not in fresh]
+  ranked_candidates = ranking.get_ranker().rank(candidates, count - len(fresh_ids))
+  return fresh_ids + [candidate.id for candidate in ranked_candidates]
+
+
+async def get_user_content(user_id: int, content_ids: list[int]):
+  """
+  Get content items with the user's rating of each, in the order of the given ids
+
+  Only the user's ratings are read from the database, the content and source urls come from the process caches.
+  """
+
+  content = await get_content_by_ids(content_ids)
+
+  db = await database.get_db()
+  ratings = await db.fetch_all(
+    sqlalchemy.select(database.user_content_ratings.c.content_id, database.user_content_ratings.c.rating).where(
+      (database.user_content_ratings.c.user_id == user_id) & database.user_content_ratings.c.content_id.in_(content_ids)
+    )
+  )
+  ratings_by_id = {x.content_id: x.rating for x in ratings}
+  source_urls = await get_source_urls({x["source_id"] for x in content})
+
+  return [
+    {**x, "source_url": source_urls.get(x["source_id"]), "rating": ratings_by_id.get(x["id"], 0)} for x in content
+  ]
 
 
 async def get_closest_content(user_id: int):
   db = await database.get_db()
   user = await db.fetch_one(database.users.select().where(database.users.c.id == user_id))
 
-  user_embedding = torch.tensor(user.embedding)
-
-  # Join content with user_content_ratings to get user ratings
-  content = await db.fetch_all(
+  rows = await db.fetch_all(
     """
-    SELECT
-      c.id, c.content_type, c.title, c.url, c.description, c.source_id, c.date, c.media,
-      s.url as source_url,
-      COALESCE(ucr.rating, 0) as rating
+    SELECT c.id
     FROM content c
-    LEFT JOIN user_content_ratings ucr ON c.id = ucr.content_id AND ucr.user_id = :user_id
-    LEFT JOIN sources s ON c.source_id = s.id
+    WHERE c.canonical_id IS NULL
     ORDER BY :user_embedding <-> c.embedding ASC
     LIMIT 5
     """,
-    {"user_id": user_id, "user_embedding": util.list_to_string(user_embedding.tolist())},
+    {"user_embedding": util.list_to_string(user.embedding)},
   )
 
-  return content
+  return await get_user_content(user_id, [x.id for x in rows])
+
+
+async def get_visualization_html(user_id: int, user_embeddings: list) -> str:
+  """Get the visualization of a user's embeddings, computed once for concurrent requests of the same user"""
+  # The visualization stack (scikit-learn, plotly) is only loaded once it is first needed
+  from src import visualize
+
+  return await _visualization_flights.do(user_id, lambda: visualize.get_visualization_html(user_embeddings))
 
 
 #
 #
 #
-async def update_user_embedding(user_id: int, updated_embedding: torch.Tensor):
+async def update_user_embedding(user_id: int, updated_embedding: np.ndarray):
   db = await database.get_db()
   await db.execute(database.users.update().where(database.users.c.id == user_id), {"embedding": updated_embedding})
 
@@ -194,6 +371,8 @@ async def update_user_content_rating(user_id: int, content_id: int, rating: floa
       database.user_content_ratings.insert(), {"user_id": user_id, "content_id": content_id, "rating": rating}
     )
 
+  await popularity.update_rating_stats(content_id, rating, existing_rating)
+
 
 async def handle_feedback(user_id: int, content_id: int, rating: float):
   """
@@ -210,23 +389,22 @@ async def handle_feedback(user_id: int, content_id: int, rating: float):
 
   db = await database.get_db()
   user = await db.fetch_one(database.users.select().where(database.users.c.id == user_id))
-  content = await db.fetch_one(database.content.select().where(database.content.c.id == content_id))
+  content = await db.fetch_one(
+    sqlalchemy.select(database.content.c.embedding).where(database.content.c.id == content_id)
+  )
   user_adjust_factor = await get_constant("USER_ADJUST_FACTOR")
 
   # Adjust the embedding based on the rating using exponential moving average (EMA)
   updated_embedding = user_adjust_factor * content.embedding * rating + ((1 - user_adjust_factor) * user.embedding)
 
-  # Normalize the embedding to unit length
-  norm = torch.linalg.vector_norm(torch.tensor(updated_embedding))
-  if norm > 0:
-    updated_embedding = updated_embedding / norm
-
-  # Print the geometric length (norm) of the embedding
-  print("Embedding norm: ", norm)
-  print("Updated embedding norm: ", torch.linalg.vector_norm(torch.tensor(updated_embedding)))
+  # Print the geometric length (norm) of the embedding, then normalize it to unit length
+  print("Embedding norm: ", vectors.norm(updated_embedding))
+  updated_embedding = vectors.normalize(updated_embedding)
+  print("Updated embedding norm: ", vectors.norm(updated_embedding))
 
   await update_user_embedding(user_id, updated_embedding)
   await update_user_content_rating(user_id, content_id, rating)
+  invalidate_user(user_id)
 
 
 #
@@ -245,42 +423,123 @@ async def sign_up():
 #
 #
 #
+async def get_content_embeddings(content_ids: list[int]):
+  """Get only the ids and embeddings of the given content"""
+  db = await database.get_db()
+  return await db.fetch_all(
+    sqlalchemy.select(database.content.c.id, database.content.c.embedding).where(database.content.c.id.in_(content_ids))
+  )
+
+
+async def get_content_by_ids(content_ids: list[int]):
+  """
+  Get content rows without their embeddings, in the order of the given ids
+
+  Content doesn't change once it is ingested, so rows are served from the process cache when they are in it.
+  """
+  rows = {content_id: _content_rows.get(content_id) for content_id in content_ids}
+  missing_ids = [content_id for content_id, row in rows.items() if row is None]
+  if missing_ids:
+    db = await database.get_db()
+    columns = [column for column in database.content.c if column.name != "embedding"]
+    for row in await db.fetch_all(sqlalchemy.select(*columns).where(database.content.c.id.in_(missing_ids))):
+      rows[row.id] = dict(row)
+      _content_rows.put(row.id, rows[row.id])
+  # Copies, so callers can't change the cached rows
+  return [dict(rows[content_id]) for content_id in content_ids if rows[content_id] is not None]
+
+
 async def get_onboarding_content(existing_selected_content_ids: list, existing_unselected_content_ids: list):
   db = await database.get_db()
   max_onboarding_cosine_similarity = await get_constant("MAX_ONBOARDING_COSINE_SIMILARITY")
   sample_count = await get_constant("SAMPLE_COUNT")
 
-  existing_selected_content = await db.fetch_all(
-    database.content.select().where(database.content.c.id.in_(existing_selected_content_ids))
-  )
+  existing_selected_content = await get_content_embeddings(existing_selected_content_ids)
+  existing_unselected_content = await get_content_embeddings(existing_unselected_content_ids)
 
-  existing_unselected_content = await db.fetch_all(
-    database.content.select().where(database.content.c.id.in_(existing_unselected_content_ids))
-  )
-
-  def is_far_enough(content):
-    for selected_content_item in existing_selected_content:
-      similarity = torch.cosine_similarity(
-        torch.tensor(content.embedding), torch.tensor(selected_content_item.embedding), dim=0
-      )
-      if similarity.item() > max_onboarding_cosine_similarity:
-        return False
-    return True
+  # Keep the unselected content that is far enough from all of the selected content
+  if existing_selected_content and existing_unselected_content:
+    similarities = vectors.cosine_similarity_matrix(
+      [x.embedding for x in existing_unselected_content], [x.embedding for x in existing_selected_content]
+    )
+    is_far_enough = (similarities <= max_onboarding_cosine_similarity).all(axis=1)
+    existing_unselected_content = [x for x, keep in zip(existing_unselected_content, is_far_enough) if keep]
 
   # Converts cosine similarity to L2 distance
   min_l2_distance = util.cosine_to_l2_distance(max_onboarding_cosine_similarity)
 
   print("Min L2 distance: ", min_l2_distance)
 
-  existing_unselected_content = [x for x in existing_unselected_content if is_far_enough(x)]
+  kept_content_ids = [x.id for x in existing_selected_content] + [x.id for x in existing_unselected_content]
 
   sample_count = int(sample_count) - len(existing_selected_content_ids) - len(existing_unselected_content)
 
   if sample_count <= 0:
-    return existing_selected_content + existing_unselected_content
+    return await get_content_by_ids(kept_content_ids)
+
+  existing_ids = existing_selected_content_ids + existing_unselected_content_ids
 
-  # Get a random sample of content ids that are at least min_l2_distance away from existing content
+  # Sample from a precomputed pool of diverse content, away from everything shown so far
+  pool_content_ids = await onboarding.sample_pool(
+    [x.embedding for x in existing_selected_content + existing_unselected_content],
+    existing_ids,
+    max_onboarding_cosine_similarity,
+    sample_count,
+  )
+  if len(pool_content_ids) == sample_count:
+    return await get_content_by_ids(kept_content_ids + pool_content_ids)
+
+  # The pool ran short, the rest is sampled away from the pool content too
+  kept_content_ids += pool_content_ids
+  existing_ids = existing_ids + pool_content_ids
+  sample_count -= len(pool_content_ids)
+
+  # Take one random item from each of a random sample of clusters that none of the existing content belongs to
   sample_content_ids = await db.fetch_all(
+    """
+        WITH shown_clusters AS (
+            SELECT DISTINCT cluster_id
+            FROM content_cluster_members
+            WHERE content_id IN (SELECT UNNEST(cast(:existing_ids as int[])))
+        ),
+        unseen_clusters AS (
+            SELECT id
+            FROM content_clusters
+            WHERE id NOT IN (SELECT cluster_id FROM shown_clusters)
+            ORDER BY RANDOM()
+            LIMIT :sample_count
+        )
+        SELECT m.content_id AS id
+        FROM unseen_clusters uc
+        CROSS JOIN LATERAL (
+            SELECT content_id
+            FROM content_cluster_members
+            WHERE cluster_id = uc.id
+            ORDER BY RANDOM()
+            LIMIT 1
+        ) m
+    """,
+    {"existing_ids": existing_ids, "sample_count": sample_count},
+  )
+
+  if len(sample_content_ids) == 0:
+    # The clusters have not been computed yet, or all of them have been shown
+    sample_content_ids = await sample_distant_content_ids(existing_ids, sample_count, min_l2_distance)
+
+  if len(sample_content_ids) == 0 and len(pool_content_ids) == 0:
+    raise Exception("No content found")
+
+  return await get_content_by_ids(kept_content_ids + [x.id for x in sample_content_ids])
+
+
+async def sample_distant_content_ids(existing_ids: list[int], sample_count: int, min_l2_distance: float):
+  """
+  Get a random sample of content ids that are at least min_l2_distance away from existing content
+
+  This scans all content, so it is only used when no content clusters are available.
+  """
+  db = await database.get_db()
+  return await db.fetch_all(
     """
         WITH existing_embeddings AS (
             SELECT embedding
@@ -290,6 +549,7 @@ async def get_onboarding_content(existing_selected_content_ids: list, existing_u
         SELECT c.id AS id
         FROM content c
         WHERE c.embedding IS NOT NULL
+        AND c.canonical_id IS NULL
         AND c.id NOT IN (SELECT UNNEST(cast(:existing_ids as int[])))
         AND NOT EXISTS (
             SELECT 1
@@ -299,22 +559,9 @@ async def get_onboarding_content(existing_selected_content_ids: list, existing_u
         ORDER BY RANDOM()
         LIMIT :sample_count
     """,
-    {
-      "existing_ids": existing_selected_content_ids + existing_unselected_content_ids,
-      "sample_count": sample_count,
-      "min_l2_distance": min_l2_distance,
-    },
-  )
-
-  if len(sample_content_ids) == 0:
-    raise Exception("No content found")
-
-  sample_content = await db.fetch_all(
-    database.content.select().where(database.content.c.id.in_([x.id for x in sample_content_ids]))
+    {"existing_ids": existing_ids, "sample_count": sample_count, "min_l2_distance": min_l2_distance},
   )
 
-  return existing_selected_content + existing_unselected_content + sample_content
-
 
 #
 #
@@ -330,17 +577,17 @@ async def onboard(user_id: int, liked_content_ids: list):
 
   db = await database.get_db()
 
-  liked_content = await db.fetch_all(database.content.select().where(database.content.c.id.in_(liked_content_ids)))
+  liked_content = await get_content_embeddings(liked_content_ids)
 
   # Create a user embedding based on the liked content
-  liked_embeddings = torch.tensor(np.array([x.embedding for x in liked_content]))
-  user_embedding = torch.mean(liked_embeddings, dim=0)
+  user_embedding = vectors.mean([x.embedding for x in liked_content])
 
   # Save the user embedding to the database
   db = await database.get_db()
   await db.execute(
     database.users.update().where(database.users.c.id == user_id), {"embedding": user_embedding.tolist()}
   )
+  invalidate_user(user_id)
 
 
 async def get_flavour(flavour_id: int):
@@ -372,27 +619,30 @@ async def create_flavour(user_id: int, content_id: int):
   db = await database.get_db()
 
   # Get the content item's embedding
-  content_item = await db.fetch_one(database.content.select().where(database.content.c.id == content_id))
+  content_item = await db.fetch_one(
+    sqlalchemy.select(database.content.c.embedding).where(database.content.c.id == content_id)
+  )
   if not content_item:
     return []
 
   # Create a flavour embedding based on the content item
-  flavour_embedding = torch.tensor(np.array(content_item.embedding))
+  flavour_embedding = vectors.to_matrix([content_item.embedding])[0]
 
   # Save the flavour embedding to the database
   flavour_id = await db.execute(
     database.user_flavours.insert(), {"user_id": user_id, "embedding": flavour_embedding.tolist()}
   )
 
-  recommendations = await get_recommendations(user_id, flavour_id)
+  # Not served to the user, so the flavour's fresh picks stay in the inbox and no next page is prefetched
+  recommendations = await compute_recommendations(user_id, flavour_id, take_fresh_picks=False)
 
   prompt = f"""
   Describe a short topic title (max 5 words) for a feed of articles containing the following headlines:
-  {"\n".join([x.title for x in recommendations])}
+  {"\n".join([x["title"] for x in recommendations])}
   Return only the topic title, no additional text.
   """
 
-  response = client.chat.completions.create(
+  response = await clients.get_llm_client().chat.completions.create(
     model=os.getenv("LLM_MODEL"),
     temperature=0,
     messages=[{"role": "user", "content": [{"type": "text", "text": prompt}]}],
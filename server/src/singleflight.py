@@ -0,0 +1,79 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Hashable
+
+
+def log_task_error(task: asyncio.Task):
+  # Retrieves the error of a task nobody may await, so it is logged once instead of on garbage collection
+  if not task.cancelled() and task.exception():
+    print(f"Error in background task: {task.exception()}")
+
+
+#
+#
+#
+class SingleFlight:
+  """
+  Runs concurrent calls with the same key once, every caller gets the result of the one in-flight task
+
+  Only calls in the same process are coalesced, each server worker has its own in-flight tasks.
+  """
+
+  def __init__(self):
+    self._tasks: dict[Hashable, asyncio.Task] = {}
+
+  def start(self, key: Hashable, fn: Callable[[], Awaitable]) -> asyncio.Task:
+    """Get the in-flight task of key, or start fn as the task of key"""
+    task = self._tasks.get(key)
+    if task is None:
+      task = asyncio.ensure_future(fn())
+      self._tasks[key] = task
+      task.add_done_callback(lambda _: self._tasks.pop(key, None) if self._tasks.get(key) is task else None)
+    return task
+
+  async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+    # Shielded, so a caller that goes away doesn't cancel the task for the others
+    return await asyncio.shield(self.start(key, fn))
+
+  def forget(self, predicate: Callable[[Hashable], bool]):
+    """Let later calls with a matching key start a new task instead of joining the in-flight one"""
+    for key in [x for x in self._tasks if predicate(x)]:
+      del self._tasks[key]
+
+
+class TaskCache:
+  """
+  Holds tasks started ahead of the request for their result, for ttl seconds after they were started
+
+  At most max_size tasks are held, the oldest are dropped first.
+  """
+
+  def __init__(self, ttl: float, max_size: int):
+    self.ttl = ttl
+    self.max_size = max_size
+    self._entries: dict[Hashable, tuple[float, asyncio.Task]] = {}
+
+  def __contains__(self, key: Hashable) -> bool:
+    return self.get(key) is not None
+
+  def get(self, key: Hashable) -> asyncio.Task | None:
+    entry = self._entries.get(key)
+    if entry is None:
+      return None
+    started_at, task = entry
+    if time.monotonic() - started_at > self.ttl or (task.done() and (task.cancelled() or task.exception())):
+      del self._entries[key]
+      return None
+    return task
+
+  def put(self, key: Hashable, task: asyncio.Task):
+    task.add_done_callback(log_task_error)
+    self._entries.pop(key, None)
+    self._entries[key] = (time.monotonic(), task)
+    while len(self._entries) > self.max_size:
+      del self._entries[next(iter(self._entries))]
+
+  def discard(self, predicate: Callable[[Hashable], bool]):
+    """Drop the tasks with a matching key"""
+    for key in [x for x in self._entries if predicate(x)]:
+      del self._entries[key]
@@ -1,4 +1,5 @@
 import numpy as np
+from collections import OrderedDict
 
 
 def list_to_string(list, tuple=False):
@@ -8,3 +9,26 @@ def list_to_string(list, tuple=False):
 
 def cosine_to_l2_distance(cosine_similarity):
   return np.sqrt(2 - 2 * cosine_similarity)
+
+
+class LRUCache:
+  """A map of at most max_size items, dropping the least recently used item first"""
+
+  def __init__(self, max_size: int):
+    self.max_size = max_size
+    self._items = OrderedDict()
+
+  def __len__(self):
+    return len(self._items)
+
+  def get(self, key, default=None):
+    if key not in self._items:
+      return default
+    self._items.move_to_end(key)
+    return self._items[key]
+
+  def put(self, key, value):
+    self._items[key] = value
+    self._items.move_to_end(key)
+    while len(self._items) > self.max_size:
+      self._items.popitem(last=False)
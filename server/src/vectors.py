@@ -0,0 +1,34 @@
+import numpy as np
+from src import constants
+
+
+def to_matrix(embeddings: list) -> np.ndarray:
+  """Stack embeddings into a float32 matrix with one embedding per row"""
+  if len(embeddings) == 0:
+    return np.empty((0, constants.EMBED_DIM), dtype=np.float32)
+  return np.asarray(np.stack(embeddings), dtype=np.float32)
+
+
+def from_text(text: str) -> np.ndarray:
+  """Parse a vector in the text format pgvector returns to raw queries, e.g. [0.1,0.2]"""
+  return np.array(text[1:-1].split(","), dtype=np.float32)
+
+
+def norm(embedding) -> float:
+  return float(np.linalg.norm(embedding))
+
+
+def normalize(embeddings) -> np.ndarray:
+  """Scale embeddings (a single vector or a matrix of row vectors) to unit length, leaving zero vectors as they are"""
+  embeddings = np.asarray(embeddings, dtype=np.float32)
+  norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+  return embeddings / np.where(norms > 0, norms, 1)
+
+
+def mean(embeddings: list) -> np.ndarray:
+  return to_matrix(embeddings).mean(axis=0)
+
+
+def cosine_similarity_matrix(a, b) -> np.ndarray:
+  """Cosine similarity between every row of a and every row of b, with shape (len(a), len(b))"""
+  return normalize(to_matrix(a)) @ normalize(to_matrix(b)).T
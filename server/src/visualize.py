@@ -2,9 +2,8 @@ from sklearn.manifold import TSNE
 from sklearn.decomposition import PCA
 import plotly.graph_objects as go
 import asyncio
-from src import database, service
+from src import database, service, vectors
 import numpy as np
-import torch
 from datetime import datetime, timedelta
 
 
@@ -16,16 +15,12 @@ async def visualize_user_embedding_history(user_embeddings: list):
     database.content.select().where(database.content.c.date >= datetime.now() - timedelta(days=max_content_age))
   )
 
-  embeddings = torch.tensor(np.array([x.embedding for x in all_content]))
+  embeddings = vectors.to_matrix([x.embedding for x in all_content])
 
   # Combine content and user embeddings for t-SNE
-  combined_embeddings = embeddings
+  combined_embeddings_np = embeddings
   if user_embeddings:
-    user_embeddings_tensor = torch.tensor(np.array(user_embeddings))
-    combined_embeddings = torch.cat([embeddings, user_embeddings_tensor], dim=0)
-
-  # Convert to numpy for scikit-learn
-  combined_embeddings_np = combined_embeddings.numpy()
+    combined_embeddings_np = np.concatenate([embeddings, vectors.to_matrix(user_embeddings)], axis=0)
 
   # Apply PCA first to reduce dimensionality (recommended for t-SNE)
   # Using 50 components or fewer if the data has fewer dimensions
@@ -53,10 +48,8 @@ async def visualize_user_embedding_history(user_embeddings: list):
 
   source_ids = list(set([x.source_id for x in all_content]))
 
-  sources = await db.fetch_all(database.sources.select())
-
-  # Create a mapping from source_id to source_url for legend
-  source_id_to_url = {x.id: x.url for x in sources}
+  # Mapping from source_id to source_url for legend
+  source_id_to_url = await service.get_source_urls()
 
   def get_color_for_source(source_id):
     i = source_ids.index(source_id)
@@ -0,0 +1,102 @@
+import asyncio
+import os
+import signal
+import socket
+import time
+import uvicorn
+from src import database, service
+
+# Connections kept free for the processes running next to the server: the ingestion daemon, which holds one
+# connection for its advisory lock and runs everything on it, and the cron jobs (clustering, projection, popularity,
+# pruning), which use one each and can all overlap around midnight
+RESERVED_DB_CONNECTIONS = 5
+
+
+def get_worker_count() -> int:
+  return int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+
+def get_pool_size(workers: int) -> int:
+  """Split the global connection budget between the workers"""
+  return max(1, (database.DB_CONNECTION_BUDGET - RESERVED_DB_CONNECTIONS) // workers)
+
+
+async def load_warm_state():
+  try:
+    await service.load_warm_state()
+  finally:
+    # Connections can't be shared across a fork, each worker opens its own pool
+    await database.close_db()
+
+
+def run_worker(config: uvicorn.Config, sock: socket.socket):
+  # The supervisor's signal handlers are inherited, uvicorn installs its own once it starts serving
+  signal.signal(signal.SIGTERM, signal.SIG_DFL)
+  signal.signal(signal.SIGINT, signal.SIG_DFL)
+  try:
+    uvicorn.Server(config).run(sockets=[sock])
+  finally:
+    os._exit(0)
+
+
+def serve(app: str, host: str, port: int, workers: int):
+  """
+  Serve the app from a number of forked worker processes sharing one listening socket.
+
+  The warm state is loaded before forking so that the workers share its memory pages, and each worker
+  gets a database pool sized from DB_CONNECTION_BUDGET. Workers that exit are replaced until the
+  supervisor receives SIGINT or SIGTERM.
+  """
+  pool_size = get_pool_size(workers)
+  print(f"Starting {workers} workers with up to {pool_size} database connections each")
+
+  asyncio.run(load_warm_state())
+  database.configure_pool(min_size=1, max_size=pool_size)
+
+  sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  sock.bind((host, port))
+  sock.listen(2048)
+  sock.set_inheritable(True)
+
+  config = uvicorn.Config(app, host=host, port=port, proxy_headers=True)
+  config.load()
+
+  children = set()
+  shutting_down = False
+
+  def spawn():
+    pid = os.fork()
+    if pid == 0:
+      run_worker(config, sock)
+    children.add(pid)
+
+  def shutdown(signum, frame):
+    nonlocal shutting_down
+    shutting_down = True
+    for pid in children:
+      try:
+        os.kill(pid, signal.SIGTERM)
+      except ProcessLookupError:
+        pass
+
+  signal.signal(signal.SIGTERM, shutdown)
+  signal.signal(signal.SIGINT, shutdown)
+
+  for _ in range(workers):
+    spawn()
+
+  while children:
+    try:
+      pid, status = os.wait()
+    except ChildProcessError:
+      break
+    children.discard(pid)
+    if not shutting_down:
+      print(f"Worker {pid} exited with status {status}, restarting")
+      # Avoid a tight restart loop when workers crash during startup
+      time.sleep(1)
+      spawn()
+
+  sock.close()
+  print("All workers stopped")